@@ -0,0 +1,270 @@
+import os
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models, rollups, metrics
+
+# Serves the user dashboards' KPIs, category split and monthly series from in-memory prefix
+# sums instead of SQL. Indexes are per process and rebuilt after ANALYTICS_TTL seconds, so
+# with several workers a change made through another worker shows up within that time.
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "false").lower() == "true"
+ANALYTICS_MEMORY_MB = float(os.getenv("ANALYTICS_MEMORY_MB", "64"))
+ANALYTICS_TTL = float(os.getenv("ANALYTICS_TTL", "300"))
+# Days added past the newest receipt when an index grows, so new uploads rarely reallocate.
+GROWTH_DAYS = 62
+
+# The index key of the cross-user aggregate used by the admin view.
+ALL_USERS = "all"
+TOTAL, TAX, BILLS = 0, 1, 2
+
+
+class SpendingIndex:
+    """
+    Daily spending of one user (or everyone) per category, held as cumulative sums:
+    cumulative[field, category, d] is the sum of field over the days before first_day + d,
+    for field in TOTAL, TAX, BILLS. Any date range is then two lookups per category, and a
+    monthly series one per month. Uploads change an index in place, so reads and changes
+    take its lock.
+    """
+
+    def __init__(self, first_day: datetime.date, days: int):
+        import numpy as np
+        self.first_day = first_day
+        self.days = days
+        self.lock = threading.RLock()
+        self.categories = []
+        self.cumulative = np.zeros((3, 0, days + 1))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds an index from (receipt_date, category, total, tax) rows."""
+        import numpy as np
+        rows = [row for row in rows if row[0] is not None and row[1] is not None]
+        if not rows:
+            return cls(datetime.date.today(), 0)
+        first_day = min(row[0] for row in rows).date()
+        last_day = max(row[0] for row in rows).date()
+        index = cls(first_day, (last_day - first_day).days + 1)
+        for category in sorted({row[1] for row in rows}):
+            index._category_row(category)
+        categories = np.array([index.categories.index(row[1]) for row in rows])
+        offsets = np.array([(row[0].date() - first_day).days for row in rows])
+        values = np.array([[float(row[2] or 0) for row in rows], [float(row[3] or 0) for row in rows], np.ones(len(rows))])
+        daily = np.zeros((3, len(index.categories), index.days))
+        for field in (TOTAL, TAX, BILLS):
+            np.add.at(daily[field], (categories, offsets), values[field])
+        np.cumsum(daily, axis=2, out=index.cumulative[:, :, 1:])
+        return index
+
+    @property
+    def nbytes(self) -> int:
+        return self.cumulative.nbytes
+
+    def _category_row(self, category: str) -> int:
+        import numpy as np
+        if category not in self.categories:
+            self.categories.append(category)
+            self.cumulative = np.concatenate([self.cumulative, np.zeros((3, 1, self.days + 1))], axis=1)
+        return self.categories.index(category)
+
+    def _grow(self, day: datetime.date):
+        """Extends the day axis to cover day; cumulative sums carry on unchanged past the old end."""
+        import numpy as np
+        before = max(0, (self.first_day - day).days)
+        after = max(0, (day - self.first_day).days - self.days + 1)
+        if not before and not after:
+            return
+        after = after and after + GROWTH_DAYS
+        self.cumulative = np.concatenate([
+            np.zeros(self.cumulative.shape[:2] + (before,)),
+            self.cumulative,
+            np.repeat(self.cumulative[:, :, -1:], after, axis=2),
+        ], axis=2)
+        self.first_day -= datetime.timedelta(days=before)
+        self.days += before + after
+
+    def add(self, receipt_date: datetime.datetime, category: str, total, tax, sign: int = 1):
+        """Adds (sign=1) or removes (sign=-1) one receipt in O(days)."""
+        if receipt_date is None or category is None:
+            return
+        with self.lock:
+            self._grow(receipt_date.date())
+            row = self._category_row(category)
+            offset = (receipt_date.date() - self.first_day).days
+            values = (sign * float(total or 0), sign * float(tax or 0), sign)
+            for field, value in zip((TOTAL, TAX, BILLS), values):
+                self.cumulative[field, row, offset + 1:] += value
+
+    def _bounds(self, start_date: datetime.date = None, end_date: datetime.date = None):
+        """
+        Returns the (lower, upper) column indexes for the filter used by the SQL dashboards:
+        no filter unless both dates are given, else start_date <= receipt_date < end_date + 1 day.
+        """
+        if not (start_date and end_date):
+            return 0, self.days
+        lower = min(max((start_date - self.first_day).days, 0), self.days)
+        upper = min(max((end_date - self.first_day).days + 1, 0), self.days)
+        return lower, max(lower, upper)
+
+    def _range_sums(self, lower: int, upper: int):
+        """Per-field, per-category sums over the columns [lower, upper)."""
+        return self.cumulative[:, :, upper] - self.cumulative[:, :, lower]
+
+    def kpis(self, start_date: datetime.date = None, end_date: datetime.date = None) -> dict:
+        with self.lock:
+            sums = self._range_sums(*self._bounds(start_date, end_date)).sum(axis=1)
+        return {"total_spend": round(float(sums[TOTAL]), 2), "total_tax": round(float(sums[TAX]), 2), "total_bills": int(round(sums[BILLS]))}
+
+    def by_category(self, start_date: datetime.date = None, end_date: datetime.date = None) -> list:
+        with self.lock:
+            sums = self._range_sums(*self._bounds(start_date, end_date))
+            categories = list(self.categories)
+        return [
+            {"label": category, "value": round(float(sums[TOTAL, row]), 2)}
+            for row, category in enumerate(categories) if round(sums[BILLS, row]) > 0
+        ]
+
+    def monthly(self, start_date: datetime.date = None, end_date: datetime.date = None) -> list:
+        import numpy as np
+        with self.lock:
+            lower, upper = self._bounds(start_date, end_date)
+            if lower >= upper:
+                return []
+            # Month starts strictly inside the range split it into one segment per month.
+            labels, boundaries = [], [lower]
+            month = rollups.month_start(self.first_day + datetime.timedelta(days=lower))
+            while True:
+                labels.append(month.strftime("%Y-%m"))
+                month = rollups.next_month(month)
+                offset = (month - self.first_day).days
+                if offset >= upper:
+                    break
+                boundaries.append(offset)
+            boundaries.append(upper)
+            totals = self.cumulative[TOTAL].sum(axis=0)[boundaries]
+            bills = self.cumulative[BILLS].sum(axis=0)[boundaries]
+            values, counts = np.diff(totals), np.diff(bills)
+            return [{"label": label, "value": round(float(value), 2)} for label, value, count in zip(labels, values, counts) if round(count) > 0]
+
+
+class _Registry:
+    """LRU map from user id (or ALL_USERS) to SpendingIndex, bounded by ANALYTICS_MEMORY_MB."""
+
+    def __init__(self, memory_bytes: float, ttl: float):
+        self.memory_bytes = memory_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._indexes = OrderedDict()
+        # Bumped on every change, so an index built from a query that raced a change is not kept.
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is None or entry[1] < time.time() - self.ttl:
+                self.misses += 1
+                return None, self._generations.get(key, 0)
+            self._indexes.move_to_end(key)
+            self.hits += 1
+            return entry[0], None
+
+    def put(self, key, index: SpendingIndex, generation: int):
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            self._indexes[key] = (index, time.time())
+            self._indexes.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        used = sum(index.nbytes for index, _ in self._indexes.values())
+        while used > self.memory_bytes and len(self._indexes) > 1:
+            _, (index, _) = self._indexes.popitem(last=False)
+            used -= index.nbytes
+
+    def update(self, key, change):
+        """Applies change(index) to the index of key if it is loaded, and marks key as changed."""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            entry = self._indexes.get(key)
+            if entry is not None:
+                change(entry[0])
+                self._evict()
+
+    def drop(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._indexes.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._indexes),
+                "bytes": sum(index.nbytes for index, _ in self._indexes.values()),
+                "memory_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+_registry = _Registry(ANALYTICS_MEMORY_MB * 1024 * 1024, ANALYTICS_TTL)
+
+
+def get_index(db: Session, user_id=ALL_USERS) -> SpendingIndex:
+    """Returns the spending index of a user, or of all users for ALL_USERS, building it on first use."""
+    index, generation = _registry.get(user_id)
+    if index is not None:
+        return index
+    with metrics.span("analytics.build"):
+        query = select(models.Receipt.receipt_date, models.Receipt.category, models.Receipt.total_amount, models.Receipt.tax_amount)
+        if user_id == ALL_USERS:
+            query = query.where(models.Receipt.owner_id.isnot(None))
+        else:
+            query = query.where(models.Receipt.owner_id == user_id)
+        index = SpendingIndex.from_rows(db.execute(query).all())
+    _registry.put(user_id, index, generation)
+    return index
+
+def _apply(user_id: int, receipts, sign: int):
+    receipts = list(receipts)
+
+    def change(index):
+        with index.lock:
+            for receipt in receipts:
+                index.add(receipt.receipt_date, receipt.category, receipt.total_amount, receipt.tax_amount, sign)
+    _registry.update(user_id, change)
+    _registry.update(ALL_USERS, change)
+
+def add_receipts(user_id: int, receipts):
+    """Adds committed receipts (anything with receipt_date, category, total_amount and tax_amount) to the loaded indexes."""
+    _apply(user_id, receipts, 1)
+
+def remove_receipts(user_id: int, receipts):
+    """Subtracts deleted receipts from the loaded indexes."""
+    _apply(user_id, receipts, -1)
+
+def invalidate_user(user_id: int):
+    """Forgets the indexes covering a user, e.g. after the user was deleted."""
+    _registry.drop(user_id)
+    _registry.drop(ALL_USERS)
+
+
+def get_summary(db: Session, user_id=ALL_USERS, start_date: datetime.date = None, end_date: datetime.date = None) -> dict:
+    """KPIs, category split and monthly series of a user, or of all users for ALL_USERS."""
+    index = get_index(db, user_id)
+    # One lock for the three, so they agree even if an upload lands meanwhile.
+    with index.lock:
+        return {
+            "kpis": index.kpis(start_date, end_date),
+            "category": index.by_category(start_date, end_date),
+            "time_series": index.monthly(start_date, end_date),
+        }
+
+def stats() -> dict:
+    return _registry.stats()
+
+metrics.register_cache("analytics", stats)
@@ -0,0 +1,129 @@
+import io
+import re
+import csv
+import json
+import itertools
+from . import crud, schemas
+
+RECEIPT_FIELDS = ("seller_name", "category", "receipt_date", "total_amount", "tax_amount")
+REQUIRED_CSV_FIELDS = ("seller_name", "category", "receipt_date", "total_amount")
+ITEM_FIELDS = ("item_name", "quantity", "rate", "subtotal")
+# Binary uploads are decoded with errors="surrogateescape", which turns invalid UTF-8 bytes into these.
+_UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+
+class InvalidImportFile(ValueError):
+    """The file as a whole cannot be read, so nothing is imported."""
+
+def _loads(text: str):
+    """Decodes one JSON value, raising ValueError for invalid UTF-8 or JSON."""
+    if _UNDECODABLE.search(text):
+        raise ValueError("Not valid UTF-8.")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+
+def _ndjson_rows(stream):
+    for line in stream:
+        if line.strip():
+            try:
+                yield _loads(line)
+            except ValueError as e:
+                yield e
+
+def read_json(stream):
+    """
+    Returns an iterator of receipt dicts from a JSON array, a {"receipts": [...]} object,
+    or newline-delimited JSON (one receipt per line, read lazily). Raises InvalidImportFile
+    if the file is none of these. An unreadable NDJSON line is yielded as a ValueError in
+    place of its receipt, so the other lines are still imported.
+    """
+    first_line = stream.readline()
+    while first_line and not first_line.strip():
+        first_line = stream.readline()
+    if not first_line:
+        return iter(())
+    try:
+        first = _loads(first_line)
+    except ValueError:
+        # A pretty-printed document spanning several lines.
+        try:
+            first = _loads(first_line + stream.read())
+        except ValueError as e:
+            raise InvalidImportFile(f"The file is neither a JSON document nor one JSON object per line. {e}")
+    if isinstance(first, list):
+        return iter(first)
+    if not isinstance(first, dict):
+        raise InvalidImportFile("Expected a JSON array, a {\"receipts\": [...]} object or one JSON object per line.")
+    if "receipts" in first:
+        if not isinstance(first["receipts"], list):
+            raise InvalidImportFile("\"receipts\" must be a JSON array.")
+        return iter(first["receipts"])
+    return itertools.chain([first], _ndjson_rows(stream))
+
+def _csv_receipts(reader):
+    current, current_key, current_error = None, None, None
+    rows = iter(reader)
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            current_error = ValueError(f"Invalid CSV row: {e}")
+            continue
+        key = row.get("receipt_ref") or tuple(row.get(field) for field in ("seller_name", "receipt_date", "total_amount"))
+        if current is None or key != current_key:
+            if current is not None:
+                yield current_error or current
+            current = {field: row.get(field) or None for field in RECEIPT_FIELDS}
+            current["items"] = []
+            current_key, current_error = key, None
+        if any(_UNDECODABLE.search(value) for value in row.values() if isinstance(value, str)):
+            current_error = ValueError("Not valid UTF-8.")
+        if row.get("item_name"):
+            current["items"].append({field: row.get(field) for field in ITEM_FIELDS})
+    if current is not None:
+        yield current_error or current
+
+def read_csv(stream):
+    """
+    Returns an iterator of receipt dicts from a CSV with one row per item. Consecutive rows
+    with the same receipt_ref column (or, without it, the same seller, date and total) form
+    one receipt. Rows without item_name describe receipts without items.
+    Raises InvalidImportFile if the header lacks the receipt columns; a receipt with an
+    unreadable row is yielded as a ValueError instead.
+    """
+    reader = csv.DictReader(stream)
+    try:
+        fieldnames = reader.fieldnames or []
+    except csv.Error as e:
+        raise InvalidImportFile(f"Invalid CSV header: {e}")
+    missing = [field for field in REQUIRED_CSV_FIELDS if field not in fieldnames]
+    if missing:
+        raise InvalidImportFile(f"The CSV header lacks the columns: {', '.join(missing)}.")
+    return _csv_receipts(reader)
+
+def _validated(rows, errors: list):
+    for number, row in enumerate(rows, start=1):
+        if isinstance(row, ValueError):
+            errors.append({"receipt": number, "error": str(row)})
+            continue
+        try:
+            yield schemas.ReceiptCreate(**row)
+        except Exception as e:
+            errors.append({"receipt": number, "error": str(e)})
+
+def import_file(db, stream, filename: str, user_id: int, user_email: str, batch_size: int = 1000) -> dict:
+    """
+    Imports already-structured receipts from a JSON/NDJSON or CSV file object (binary or text).
+    Invalid receipts are skipped and reported; the rest are inserted in batches. Raises
+    InvalidImportFile, before anything is inserted, if the file cannot be read at all.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="surrogateescape", newline="")
+    rows = read_csv(stream) if filename.lower().endswith(".csv") else read_json(stream)
+    errors = []
+    imported = crud.import_receipts(db, _validated(rows, errors), user_id=user_id, user_email=user_email, batch_size=batch_size)
+    return {"imported": imported, "failed": len(errors), "errors": errors[:100]}
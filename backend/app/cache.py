@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from . import metrics
+
+CACHE_SIZE = int(os.getenv("RECEIPT_CACHE_SIZE", "5000"))
+CACHE_PATH = os.getenv("RECEIPT_CACHE_PATH")
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def normalize_ocr_text(text: str) -> str:
+    """Folds width variants and whitespace so trivially different OCR runs share a key."""
+    text = unicodedata.normalize("NFKC", text)
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def hash_ocr_text(text: str) -> str:
+    return hash_bytes(normalize_ocr_text(text).encode("utf-8"))
+
+
+class LRUCache:
+    """A size-bounded, thread-safe in-memory LRU cache with hit/miss counters."""
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "size": len(self), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """The same interface as LRUCache, persisted in a SQLite file so it survives restarts."""
+
+    def __init__(self, path: str, namespace: str, max_size: int = CACHE_SIZE):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_lru ON cache_entries (namespace, last_used)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET last_used = ? WHERE namespace = ? AND key = ?", (time.time(), self.namespace, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, last_used) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_size),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT count(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", "size": len(self), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+def make_cache(namespace: str):
+    if CACHE_PATH:
+        return SQLiteCache(CACHE_PATH, namespace)
+    return LRUCache()
+
+# OCR text keyed by the SHA-256 of the uploaded image bytes.
+ocr_cache = make_cache("ocr")
+# Parsed receipt dictionaries keyed by the hash of the normalized OCR text.
+parse_cache = make_cache("parse")
+metrics.register_cache("ocr", ocr_cache.stats)
+metrics.register_cache("parse", parse_cache.stats)
+
+def stats() -> dict:
+    return {"ocr": ocr_cache.stats(), "parse": parse_cache.stats()}
@@ -0,0 +1,111 @@
+import re
+import unicodedata
+from sqlalchemy import inspect, insert, select, text, update, bindparam
+from sqlalchemy.orm import Session
+from . import models, database
+
+# Product/JAN codes printed before or after the name, e.g. "4901234567894 お茶" or "お茶 #0123".
+_CODE_PREFIX = re.compile(r"^(?:#?\d{4,}|[a-z]{1,2}\d{3,})[\s:.\-_/]+", re.IGNORECASE)
+_CODE_SUFFIX = re.compile(r"[\s:.\-_/]+(?:#?\d{4,}|[a-z]{1,2}\d{3,}|#\d+)$", re.IGNORECASE)
+# Reduced-tax and discount marks (軽, ※, *) and stray punctuation around the name.
+_MARKS = re.compile(r"^[\s※*・.\-]+|[\s※*・.\-]+(?:軽)?[\s※*]*$|\s+軽$")
+
+
+def display_name(name: str) -> str:
+    """Cleans an item name for display: NFKC, single spaces, and no codes or tax marks."""
+    name = " ".join(unicodedata.normalize("NFKC", name or "").split())
+    previous = None
+    while name and name != previous:
+        previous = name
+        name = _MARKS.sub("", name)
+        name = _CODE_PREFIX.sub("", name)
+        name = _CODE_SUFFIX.sub("", name)
+        name = name.strip()
+    return name
+
+def normalize_item_name(name: str) -> str:
+    """
+    Returns the catalog key for a free-form item name: NFKC (full/half width), case-folded,
+    with codes, tax marks and repeated whitespace removed. Returns "" if nothing is left.
+    """
+    return display_name(name).casefold()
+
+def _insert_missing(db: Session, rows: list):
+    table = models.CanonicalItem.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        db.execute(dialect_insert(table).on_conflict_do_nothing(index_elements=["name"]), rows)
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        db.execute(dialect_insert(table).on_conflict_do_nothing(index_elements=["name"]), rows)
+    else:
+        db.execute(insert(table), rows)
+
+def canonical_ids(db: Session, names) -> dict:
+    """
+    Maps raw item names to canonical_items ids, adding catalog entries for unseen names
+    (the first spelling seen becomes the display name). Does not commit.
+    """
+    keys = {}
+    for name in names:
+        key = normalize_item_name(name)
+        if key:
+            keys.setdefault(key, name)
+    if not keys:
+        return {}
+    id_by_key = dict(db.execute(select(models.CanonicalItem.name, models.CanonicalItem.id).where(models.CanonicalItem.name.in_(keys))).all())
+    missing = [{"name": key, "display_name": display_name(name)} for key, name in keys.items() if key not in id_by_key]
+    if missing:
+        # Conflicts are entries another transaction just added; re-reading picks their ids up.
+        _insert_missing(db, missing)
+        id_by_key.update(db.execute(
+            select(models.CanonicalItem.name, models.CanonicalItem.id)
+            .where(models.CanonicalItem.name.in_([row["name"] for row in missing]))
+        ).all())
+    return {name: id_by_key.get(normalize_item_name(name)) for name in names}
+
+
+def ensure_schema(db: Session):
+    """
+    Brings databases created before the catalog existed up to date: adds canonical_items,
+    items.canonical_item_id and its index, and recreates the item rollup table, which used
+    to be keyed by the raw name (rollups.rebuild refills it).
+    """
+    bind = db.get_bind()
+    models.Base.metadata.create_all(bind=bind, tables=[models.CanonicalItem.__table__])
+    inspector = inspect(bind)
+    if "canonical_item_id" not in {column["name"] for column in inspector.get_columns("items")}:
+        db.execute(text("ALTER TABLE items ADD COLUMN canonical_item_id INTEGER REFERENCES canonical_items (id)"))
+    database.create_indexes(db, models.Item.__table__.indexes)
+    rollup_table = models.MonthlyItemSpending.__table__
+    if inspector.has_table(rollup_table.name) and "canonical_item_id" not in {column["name"] for column in inspector.get_columns(rollup_table.name)}:
+        rollup_table.drop(bind=db.connection())
+    rollup_table.create(bind=db.connection(), checkfirst=True)
+    db.commit()
+
+def backfill(db: Session, batch_size: int = 5000) -> int:
+    """Fills canonical_item_id for items that do not have one yet, committing per batch."""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(models.Item.id, models.Item.item_name)
+            .where(models.Item.canonical_item_id.is_(None), models.Item.id > last_id)
+            .order_by(models.Item.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+        ids = canonical_ids(db, [name for _, name in rows])
+        params = [{"item_id": item_id, "canonical_id": ids[name]} for item_id, name in rows if ids.get(name)]
+        if params:
+            db.connection().execute(
+                update(models.Item.__table__)
+                .where(models.Item.__table__.c.id == bindparam("item_id"))
+                .values(canonical_item_id=bindparam("canonical_id")),
+                params,
+            )
+        db.commit()
+        updated += len(params)
+        last_id = rows[-1][0]
@@ -1,12 +1,36 @@
+import base64
 import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from . import models, schemas, security
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, and_, or_, insert, tuple_, select, literal, null, union_all, String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from . import models, schemas, security, rollups, dashboard_cache, catalog, search, deletion, analytics, metrics
 
 
+class year_month(FunctionElement):
+    """Formats a date or timestamp as 'YYYY-MM' on both Postgres and SQLite."""
+    type = String()
+    name = "year_month"
+    inherit_cache = True
+
+@compiles(year_month)
+def _year_month_postgresql(element, compiler, **kw):
+    return "to_char(%s, 'YYYY-MM')" % compiler.process(element.clauses, **kw)
+
+@compiles(year_month, "sqlite")
+def _year_month_sqlite(element, compiler, **kw):
+    return "strftime('%%Y-%%m', %s)" % compiler.process(element.clauses, **kw)
+
+
+@metrics.timed
+def get_user_by_id(db: Session, user_id: int):
+    return db.get(models.User, user_id)
+
+@metrics.timed
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
+@metrics.timed
 def create_user(db: Session, user: schemas.UserCreate):
     hashed_password = security.get_password_hash(user.password)
     db_user = models.User(email=user.email, hashed_password=hashed_password)
@@ -15,133 +39,287 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
+def _insert_receipts(db: Session, receipts: list, user_id: int, user_email: str):
+    """
+    Bulk-inserts receipts (one INSERT ... RETURNING) and then all their items (one executemany),
+    linked to the item catalog, and adds them to the monthly rollups and search index, without committing.
+    Returns the new Receipt objects in input order.
+    """
+    if not receipts:
+        return []
+    receipt_rows = [
+        dict(receipt.model_dump(exclude={"items"}), owner_id=user_id, owner_email=user_email)
+        for receipt in receipts
+    ]
+    db_receipts = db.scalars(
+        insert(models.Receipt).returning(models.Receipt, sort_by_parameter_order=True),
+        receipt_rows,
+    ).all()
+    canonical_ids = catalog.canonical_ids(db, {item.item_name for receipt in receipts for item in receipt.items})
+    item_rows = [
+        dict(item_data.model_dump(), receipt_id=db_receipt.id, canonical_item_id=canonical_ids.get(item_data.item_name))
+        for receipt, db_receipt in zip(receipts, db_receipts)
+        for item_data in receipt.items
+    ]
+    if item_rows:
+        db.execute(insert(models.Item), item_rows)
+    rollups.add_receipts(db, receipts, user_id=user_id, canonical_ids=canonical_ids)
+    search.index_receipts(db, zip(db_receipts, receipts), user_id=user_id)
+    return db_receipts
+
+@metrics.timed
 def create_receipt(db: Session, receipt: schemas.ReceiptCreate, user_id: int, user_email: str):
-    db_receipt = models.Receipt(
-        seller_name=receipt.seller_name,
-        category=receipt.category,
-        receipt_date=receipt.receipt_date,
-        total_amount=receipt.total_amount,
-        tax_amount=receipt.tax_amount,
-        owner_id=user_id,
-        owner_email=user_email
-    )
-    db.add(db_receipt)
-    db.commit()
-    db.refresh(db_receipt)
-    for item_data in receipt.items:
-        db_item = models.Item(**item_data.dict(), receipt_id=db_receipt.id)
-        db.add(db_item)
-    db.commit()
-    db.refresh(db_receipt)
-    return db_receipt
+    return create_receipts(db, [receipt], user_id=user_id, user_email=user_email)[0]
+
+@metrics.timed
+def create_receipts(db: Session, receipts: list, user_id: int, user_email: str):
+    """Inserts several receipts and their items in a single transaction."""
+    try:
+        db_receipts = _insert_receipts(db, receipts, user_id=user_id, user_email=user_email)
+        with metrics.span("crud.commit", metrics.crud_seconds, function="commit"):
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    dashboard_cache.invalidate_user(user_id)
+    analytics.add_receipts(user_id, receipts)
+    return db_receipts
+
+@metrics.timed
+def import_receipts(db: Session, receipts, user_id: int, user_email: str, batch_size: int = 1000):
+    """
+    Imports an iterable of schemas.ReceiptCreate, committing every batch_size receipts.
+    Returns the number of receipts imported.
+    """
+    imported = 0
+    batch = []
+    for receipt in receipts:
+        batch.append(receipt)
+        if len(batch) >= batch_size:
+            imported += len(create_receipts(db, batch, user_id=user_id, user_email=user_email))
+            db.expunge_all()
+            batch = []
+    if batch:
+        imported += len(create_receipts(db, batch, user_id=user_id, user_email=user_email))
+        db.expunge_all()
+    return imported
+
+@metrics.timed
+def find_duplicate_receipt(db: Session, receipt: schemas.ReceiptCreate, user_id: int):
+    """Returns an existing receipt of the user with the same seller, date and total, if any."""
+    return db.query(models.Receipt).filter(
+        models.Receipt.owner_id == user_id,
+        models.Receipt.seller_name == receipt.seller_name,
+        models.Receipt.receipt_date == receipt.receipt_date,
+        models.Receipt.total_amount == receipt.total_amount,
+    ).first()
 
-def get_receipts_by_user(db: Session, user_id: int, limit: int = 20):
-    return db.query(models.Receipt).filter(models.Receipt.owner_id == user_id).order_by(models.Receipt.upload_date.desc()).limit(limit).all()
+RECEIPT_PAGE_SIZE_MAX = 500
 
-def get_all_receipts_by_user(db: Session, user_id: int):
-    return db.query(models.Receipt).filter(models.Receipt.owner_id == user_id).order_by(models.Receipt.upload_date.desc()).all()
+def encode_cursor(receipt: models.Receipt) -> str:
+    return base64.urlsafe_b64encode(f"{receipt.upload_date.isoformat()}|{receipt.id}".encode()).decode()
 
+def decode_cursor(cursor: str):
+    """Returns (upload_date, id) from a cursor, raising ValueError if it is malformed."""
+    try:
+        upload_date, receipt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(upload_date), int(receipt_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def filter_receipts(query, start_date: datetime.date = None, end_date: datetime.date = None, category: str = None, seller: str = None):
+    if start_date:
+        query = query.filter(models.Receipt.receipt_date >= start_date)
+    if end_date:
+        query = query.filter(models.Receipt.receipt_date < end_date + datetime.timedelta(days=1))
+    if category:
+        query = query.filter(models.Receipt.category == category)
+    if seller:
+        query = query.filter(models.Receipt.seller_name.ilike(f"%{seller}%"))
+    return query
+
+@metrics.timed
+def get_receipts_page(db: Session, user_id: int = None, cursor: str = None, limit: int = 100,
+                      start_date: datetime.date = None, end_date: datetime.date = None, category: str = None, seller: str = None,
+                      include_items: bool = True):
+    """
+    Returns (receipts, next_cursor) for one page of receipts, newest upload first, using keyset
+    pagination on (upload_date, id). Items, if included, are loaded with one more query.
+    user_id=None pages over every user's receipts.
+    """
+    limit = max(1, min(limit, RECEIPT_PAGE_SIZE_MAX))
+    query = db.query(models.Receipt)
+    if include_items:
+        query = query.options(selectinload(models.Receipt.items))
+    if user_id is not None:
+        query = query.filter(models.Receipt.owner_id == user_id)
+    query = filter_receipts(query, start_date=start_date, end_date=end_date, category=category, seller=seller)
+    if cursor:
+        query = query.filter(tuple_(models.Receipt.upload_date, models.Receipt.id) < tuple_(*decode_cursor(cursor)))
+    receipts = query.order_by(models.Receipt.upload_date.desc(), models.Receipt.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(receipts[limit - 1]) if len(receipts) > limit else None
+    return receipts[:limit], next_cursor
+
+@metrics.timed
+def get_receipts_by_user(db: Session, user_id: int, limit: int = 20, include_items: bool = True):
+    query = db.query(models.Receipt)
+    if include_items:
+        query = query.options(selectinload(models.Receipt.items))
+    return query.filter(models.Receipt.owner_id == user_id).order_by(models.Receipt.upload_date.desc()).limit(limit).all()
+
+@metrics.timed
 def get_receipt_by_id(db: Session, receipt_id: int):
     return db.query(models.Receipt).filter(models.Receipt.id == receipt_id).first()
 
+@metrics.timed
 def delete_receipt(db: Session, receipt_id: int):
     db_receipt = get_receipt_by_id(db, receipt_id=receipt_id)
     if db_receipt:
+        owner_id = db_receipt.owner_id
+        rollups.remove_receipts(db, [db_receipt])
+        search.remove_receipt(db, receipt_id)
         db.delete(db_receipt)
         db.commit()
+        dashboard_cache.invalidate_user(owner_id)
+        analytics.remove_receipts(owner_id, [db_receipt])
         return True
     return False
 
-def get_kpi_data(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None):
-    query = db.query(
-        func.sum(models.Receipt.total_amount),
-        func.sum(models.Receipt.tax_amount),
-        func.count(models.Receipt.id)
-    ).filter(models.Receipt.owner_id == user_id)
-
+def _spending_sources(user_id: int, start_date: datetime.date = None, end_date: datetime.date = None):
+    """
+    Returns (spending, items) subqueries covering the user's receipts in the date range, which
+    includes all of end_date as in filter_receipts: whole months come from the monthly rollups
+    and only the partial edge months from raw rows.
+    """
+    spending_selects = [
+        select(models.MonthlySpending.category.label("category"), year_month(models.MonthlySpending.month).label("month"),
+               models.MonthlySpending.total_amount.label("total"), models.MonthlySpending.tax_amount.label("tax"),
+               models.MonthlySpending.receipt_count.label("bills"))
+        .where(models.MonthlySpending.owner_id == user_id)
+    ]
+    item_selects = [
+        select(models.MonthlyItemSpending.canonical_item_id.label("canonical_item_id"), models.MonthlyItemSpending.subtotal.label("subtotal"))
+        .where(models.MonthlyItemSpending.owner_id == user_id)
+    ]
     if start_date and end_date:
-        query = query.filter(and_(models.Receipt.receipt_date >= start_date, models.Receipt.receipt_date <= end_date))
+        first_month, end_month, raw_ranges = rollups.split_date_range(start_date, end_date)
+        if first_month is None:
+            spending_selects, item_selects = [], []
+        else:
+            spending_selects[0] = spending_selects[0].where(models.MonthlySpending.month >= first_month, models.MonthlySpending.month < end_month)
+            item_selects[0] = item_selects[0].where(models.MonthlyItemSpending.month >= first_month, models.MonthlyItemSpending.month < end_month)
+        if raw_ranges:
+            raw_dates = or_(*(and_(models.Receipt.receipt_date >= lower, models.Receipt.receipt_date < upper) for lower, upper in raw_ranges))
+            spending_selects.append(
+                select(models.Receipt.category.label("category"), year_month(models.Receipt.receipt_date).label("month"),
+                       models.Receipt.total_amount.label("total"), models.Receipt.tax_amount.label("tax"), literal(1).label("bills"))
+                .where(models.Receipt.owner_id == user_id, raw_dates)
+            )
+            item_selects.append(
+                select(models.Item.canonical_item_id.label("canonical_item_id"), models.Item.subtotal.label("subtotal"))
+                .join(models.Receipt, models.Item.receipt_id == models.Receipt.id)
+                .where(models.Receipt.owner_id == user_id, raw_dates)
+            )
+    return union_all(*spending_selects).subquery("spending"), union_all(*item_selects).subquery("item_spending")
 
-    total_spend, total_tax, total_bills = query.first()
+def _top_items_select(items, limit: int):
+    """Ranks on the integer catalog key and only looks up display names for the winners."""
+    ranked = (
+        select(items.c.canonical_item_id, func.sum(items.c.subtotal).label("value"))
+        .where(items.c.canonical_item_id.isnot(None))
+        .group_by(items.c.canonical_item_id)
+        .order_by(func.sum(items.c.subtotal).desc())
+        .limit(limit)
+        .subquery("ranked_items")
+    )
+    return (
+        select(models.CanonicalItem.display_name.label("label"), ranked.c.value)
+        .join(ranked, models.CanonicalItem.id == ranked.c.canonical_item_id)
+        .order_by(ranked.c.value.desc())
+    )
+
+@metrics.timed
+def get_kpi_data(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None):
+    if analytics.ANALYTICS_ENABLED:
+        return analytics.get_index(db, user_id).kpis(start_date, end_date)
+    spending, _ = _spending_sources(user_id, start_date, end_date)
+    total_spend, total_tax, total_bills = db.execute(
+        select(func.sum(spending.c.total), func.sum(spending.c.tax), func.sum(spending.c.bills))
+    ).first()
     return {
         "total_spend": total_spend or 0.0,
         "total_tax": total_tax or 0.0,
         "total_bills": total_bills or 0
     }
 
+@metrics.timed
 def get_spending_over_time(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None):
-    query = db.query(
-        func.to_char(models.Receipt.receipt_date, "YYYY-MM").label("label"),
-        func.sum(models.Receipt.total_amount).label("value"),
-    ).filter(models.Receipt.owner_id == user_id)
-    
-    if start_date and end_date:
-        query = query.filter(and_(models.Receipt.receipt_date >= start_date, models.Receipt.receipt_date <= end_date))
-
-    return query.group_by("label").order_by("label").all()
+    if analytics.ANALYTICS_ENABLED:
+        return analytics.get_index(db, user_id).monthly(start_date, end_date)
+    spending, _ = _spending_sources(user_id, start_date, end_date)
+    return db.execute(
+        select(spending.c.month.label("label"), func.sum(spending.c.total).label("value"))
+        .group_by(spending.c.month)
+        .order_by(spending.c.month)
+    ).all()
 
+@metrics.timed
 def get_spending_by_category(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None):
-    query = db.query(
-        models.Receipt.category.label("label"),
-        func.sum(models.Receipt.total_amount).label("value"),
-    ).filter(models.Receipt.owner_id == user_id)
-
-    if start_date and end_date:
-        query = query.filter(and_(models.Receipt.receipt_date >= start_date, models.Receipt.receipt_date <= end_date))
-        
-    return query.group_by("label").all()
+    if analytics.ANALYTICS_ENABLED:
+        return analytics.get_index(db, user_id).by_category(start_date, end_date)
+    spending, _ = _spending_sources(user_id, start_date, end_date)
+    return db.execute(
+        select(spending.c.category.label("label"), func.sum(spending.c.total).label("value"))
+        .group_by(spending.c.category)
+    ).all()
 
+@metrics.timed
 def get_top_items(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None, limit: int = 10):
-    query = (
-        db.query(
-            models.Item.item_name.label("label"),
-            func.sum(models.Item.subtotal).label("value"),
-        )
-        .join(models.Receipt)
-        .filter(models.Receipt.owner_id == user_id)
-    )
-
-    if start_date and end_date:
-        query = query.filter(and_(models.Receipt.receipt_date >= start_date, models.Receipt.receipt_date <= end_date))
+    """Calculates the top spending by item for a user, optionally filtered by date."""
+    _, items = _spending_sources(user_id, start_date, end_date)
+    return db.execute(_top_items_select(items, limit)).all()
 
-    return (
-        query.group_by(models.Item.item_name)
-        .order_by(func.sum(models.Item.subtotal).desc())
-        .limit(limit)
-        .all()
+@metrics.timed
+def get_dashboard_summary(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None, top_items_limit: int = 10):
+    """
+    Computes the KPIs, category split, monthly series and top items in a single round-trip
+    over the monthly rollups (plus raw rows for partial months), UNION ALLing the four aggregates.
+    With ANALYTICS_ENABLED, only the top items come from SQL.
+    """
+    if analytics.ANALYTICS_ENABLED:
+        summary = analytics.get_summary(db, user_id, start_date, end_date)
+        summary["top_items"] = get_top_items(db, user_id, start_date, end_date, limit=top_items_limit)
+        return summary
+    spending, items = _spending_sources(user_id, start_date, end_date)
+    top_items = _top_items_select(items, top_items_limit).subquery()
+    statement = union_all(
+        select(literal("kpi").label("kind"), null().label("label"), func.sum(spending.c.total).label("value"),
+               func.sum(spending.c.tax).label("tax"), func.sum(spending.c.bills).label("bills")),
+        select(literal("category"), spending.c.category, func.sum(spending.c.total), null(), null())
+        .group_by(spending.c.category),
+        select(literal("month"), spending.c.month, func.sum(spending.c.total), null(), null())
+        .group_by(spending.c.month),
+        select(literal("item"), top_items.c.label, top_items.c.value, null(), null()),
     )
+    summary = {"kpis": None, "category": [], "time_series": [], "top_items": []}
+    for kind, label, value, tax, bills in db.execute(statement):
+        if kind == "kpi":
+            summary["kpis"] = {"total_spend": value or 0.0, "total_tax": tax or 0.0, "total_bills": bills or 0}
+        elif kind == "category":
+            summary["category"].append({"label": label, "value": value})
+        elif kind == "month":
+            summary["time_series"].append({"label": label, "value": value})
+        else:
+            summary["top_items"].append({"label": label, "value": value})
+    summary["time_series"].sort(key=lambda point: point["label"])
+    summary["top_items"].sort(key=lambda point: point["value"], reverse=True)
+    return summary
 
+@metrics.timed
 def get_all_users(db: Session):
     return db.query(models.User).all()
 
-def get_all_receipts(db: Session):
-    return db.query(models.Receipt).order_by(models.Receipt.upload_date.desc()).all()
-
+@metrics.timed
 def delete_user(db: Session, user_id: int):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user:
-        db.delete(db_user)
-        db.commit()
-        return True
-    return False
-
-def get_top_items(db: Session, user_id: int, start_date: datetime.date = None, end_date: datetime.date = None, limit: int = 10):
-    """Calculates the top spending by item for a user, optionally filtered by date."""
-    query = (
-        db.query(
-            models.Item.item_name.label("label"),
-            func.sum(models.Item.subtotal).label("value"),
-        )
-        .join(models.Receipt)
-        .filter(models.Receipt.owner_id == user_id)
-    )
-
-    if start_date and end_date:
-        query = query.filter(and_(models.Receipt.receipt_date >= start_date, models.Receipt.receipt_date <= end_date))
-
-    return (
-        query.group_by(models.Item.item_name)
-        .order_by(func.sum(models.Item.subtotal).desc())
-        .limit(limit)
-        .all()
-    )
\ No newline at end of file
+    """Deletes a user and all their data in batches (see app.deletion). Returns False if there is no such user."""
+    return deletion.delete_user(db, user_id) is not None
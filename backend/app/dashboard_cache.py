@@ -0,0 +1,131 @@
+import os
+import time
+import hashlib
+import importlib
+import threading
+from collections import OrderedDict, defaultdict
+from . import metrics
+
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "2000"))
+# "module:attribute" of a factory returning a shared backend, e.g. one backed by Redis.
+DASHBOARD_CACHE_BACKEND = os.getenv("DASHBOARD_CACHE_BACKEND")
+
+
+class MemoryDashboardCache:
+    """
+    The default, per-process backend: a TTL and size-bounded LRU map from cache keys to entries,
+    plus the time each user's data last changed. A shared backend for several workers only needs
+    the same get/set/invalidate_user/last_modified/generation/stats methods.
+    """
+
+    def __init__(self, max_size: int = DASHBOARD_CACHE_SIZE, ttl: float = DASHBOARD_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._user_keys = defaultdict(set)
+        self._modified = {}
+        # Bumped on every invalidation, so a body computed from data that changed meanwhile is not kept.
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def _drop(self, key):
+        user_id, _ = self._data.pop(key)
+        self._user_keys[user_id].discard(key)
+        if not self._user_keys[user_id]:
+            del self._user_keys[user_id]
+
+    def get(self, user_id: int, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1]["expires_at"] < time.time():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id: int, key: str, entry: dict, generation: int = None):
+        """Stores entry, unless generation is given and the user was invalidated since it was read."""
+        with self._lock:
+            if generation is not None and self._generations.get(user_id, 0) != generation:
+                return
+            entry = dict(entry, expires_at=time.time() + self.ttl)
+            self._data[key] = (user_id, entry)
+            self._data.move_to_end(key)
+            self._user_keys[user_id].add(key)
+            while len(self._data) > self.max_size:
+                self._drop(next(iter(self._data)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._drop(key)
+            self._modified[user_id] = time.time()
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def last_modified(self, user_id: int):
+        with self._lock:
+            return self._modified.get(user_id)
+
+    def generation(self, user_id: int) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        return {"backend": "memory", "size": size, "max_size": self.max_size, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+def _load_backend():
+    if not DASHBOARD_CACHE_BACKEND:
+        return MemoryDashboardCache()
+    module_name, _, factory = DASHBOARD_CACHE_BACKEND.partition(":")
+    return getattr(importlib.import_module(module_name), factory)()
+
+backend = _load_backend()
+
+def set_backend(new_backend):
+    """Swaps the dashboard cache backend, e.g. for a shared cache when running several workers."""
+    global backend
+    backend = new_backend
+
+
+def make_key(user_id: int, endpoint: str, start_date=None, end_date=None) -> str:
+    return f"dashboard:{user_id}:{endpoint}:{start_date or ''}:{end_date or ''}"
+
+async def get_or_compute(user_id: int, endpoint: str, start_date, end_date, compute) -> dict:
+    """
+    Returns the cached entry for the dashboard request, awaiting compute() for the JSON body
+    (bytes) on a miss. Entries carry the body, its ETag and a Last-Modified timestamp.
+    A body is not cached if the user's data was invalidated while it was being computed.
+    """
+    key = make_key(user_id, endpoint, start_date, end_date)
+    entry = backend.get(user_id, key)
+    if entry is not None:
+        return entry
+    generation = backend.generation(user_id)
+    body = await compute()
+    entry = {
+        "body": body,
+        "etag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+        # Before the first change seen since startup, the computation time is the best we know.
+        "last_modified": backend.last_modified(user_id) or time.time(),
+    }
+    backend.set(user_id, key, entry, generation=generation)
+    return entry
+
+def invalidate_user(user_id: int):
+    """Drops a user's cached dashboard responses after their receipts change."""
+    if user_id is not None:
+        backend.invalidate_user(user_id)
+
+def stats() -> dict:
+    return backend.stats()
+
+metrics.register_cache("dashboard", stats)
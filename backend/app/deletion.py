@@ -0,0 +1,171 @@
+import os
+import uuid
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from . import models, rollups, search, dashboard_cache, analytics, security, metrics
+from .database import SessionLocal
+
+# Receipts removed per transaction. Each batch commits on its own, so row locks are held
+# briefly and other requests are never blocked for the length of a whole account.
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", "1000"))
+JOB_HISTORY_SIZE = int(os.getenv("DELETE_JOB_HISTORY", "100"))
+
+FINISHED_STATUSES = ("completed", "failed")
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # One deletion at a time, so several admin deletes do not compete for the same locks.
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deletion")
+        return _executor
+
+
+def delete_receipts_where(db: Session, condition, batch_size: int = DELETE_BATCH_SIZE, progress=None) -> dict:
+    """
+    Deletes the receipts matching condition with their items and search terms, batch_size
+    receipts per transaction, using set-based DELETE ... WHERE id IN (...) statements.
+    Each batch is subtracted from the rollups in its own transaction, so they stay in step
+    with the receipts if a later batch fails. Calls progress(counts) after each batch;
+    returns the counts.
+    """
+    counts = {"receipts": 0, "items": 0}
+    while True:
+        receipt_ids = db.scalars(select(models.Receipt.id).where(condition).order_by(models.Receipt.id).limit(batch_size)).all()
+        if not receipt_ids:
+            return counts
+        with metrics.span("deletion.batch"):
+            rollups.remove_receipt_ids(db, receipt_ids)
+            db.execute(delete(models.SearchTerm).where(models.SearchTerm.receipt_id.in_(receipt_ids)).execution_options(synchronize_session=False))
+            counts["items"] += db.execute(delete(models.Item).where(models.Item.receipt_id.in_(receipt_ids)).execution_options(synchronize_session=False)).rowcount
+            counts["receipts"] += db.execute(delete(models.Receipt).where(models.Receipt.id.in_(receipt_ids)).execution_options(synchronize_session=False)).rowcount
+            db.commit()
+        if progress is not None:
+            progress(counts)
+
+def delete_user(db: Session, user_id: int, batch_size: int = DELETE_BATCH_SIZE, progress=None) -> dict:
+    """
+    Removes a user with all their receipts, items, rollups and search terms in bounded batches,
+    then forgets their cached dashboards and principal. Returns the counts, or None if the
+    user does not exist.
+    """
+    email = db.scalar(select(models.User.email).where(models.User.id == user_id))
+    if email is None:
+        return None
+
+    def batch_deleted(counts):
+        # Each batch commits, so nothing computed from the receipts it removed may be served,
+        # even if a later batch fails.
+        dashboard_cache.invalidate_user(user_id)
+        analytics.invalidate_user(user_id)
+        if progress is not None:
+            progress(counts)
+
+    counts = delete_receipts_where(db, models.Receipt.owner_id == user_id, batch_size=batch_size, progress=batch_deleted)
+    rollups.remove_user(db, user_id)
+    search.remove_user(db, user_id)
+    # Receipts uploaded while the batches ran are removed by ON DELETE CASCADE, and their
+    # rollup rows with the user's remaining ones.
+    db.execute(delete(models.User).where(models.User.id == user_id).execution_options(synchronize_session=False))
+    db.commit()
+    dashboard_cache.invalidate_user(user_id)
+    analytics.invalidate_user(user_id)
+    security.invalidate_principal(email)
+    return counts
+
+def clear_all(db: Session, batch_size: int = DELETE_BATCH_SIZE, progress=None) -> dict:
+    """Deletes every user and receipt (orphaned receipts included) in bounded batches. Keeps the item catalog."""
+    totals = {"users": 0, "receipts": 0, "items": 0}
+    for user_id in db.scalars(select(models.User.id).order_by(models.User.id)).all():
+        counts = delete_user(db, user_id, batch_size=batch_size)
+        if counts is not None:
+            totals["users"] += 1
+            totals["receipts"] += counts["receipts"]
+            totals["items"] += counts["items"]
+            if progress is not None:
+                progress(totals)
+    counts = delete_receipts_where(db, models.Receipt.owner_id.is_(None), batch_size=batch_size)
+    totals["receipts"] += counts["receipts"]
+    totals["items"] += counts["items"]
+    return totals
+
+
+# --- Background jobs ---
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+def submit_user_deletion(user_id: int, batch_size: int = DELETE_BATCH_SIZE) -> dict:
+    """
+    Queues the deletion of a user and returns the job; progress is reported through get_job.
+    Returns the running job instead if the user is already being deleted.
+    """
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job["user_id"] == user_id and job["status"] not in FINISHED_STATUSES:
+                return dict(job)
+        job = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "status": "queued",
+            "receipts_total": None,
+            "receipts_deleted": 0,
+            "items_deleted": 0,
+            "created_at": datetime.datetime.utcnow(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        _jobs[job["id"]] = job
+        # Forget the oldest finished jobs once the history is full.
+        while len(_jobs) > JOB_HISTORY_SIZE:
+            oldest_id = next((jid for jid, j in _jobs.items() if j["status"] in FINISHED_STATUSES), None)
+            if oldest_id is None:
+                break
+            del _jobs[oldest_id]
+        job = dict(job)
+    _get_executor().submit(_run_user_deletion, job["id"], user_id, batch_size)
+    return job
+
+def _run_user_deletion(job_id: str, user_id: int, batch_size: int):
+    db = SessionLocal()
+    try:
+        total = db.scalar(select(func.count()).select_from(models.Receipt).where(models.Receipt.owner_id == user_id))
+        _update_job(job_id, status="running", receipts_total=total, started_at=datetime.datetime.utcnow())
+
+        def progress(counts):
+            _update_job(job_id, receipts_deleted=counts["receipts"], items_deleted=counts["items"])
+
+        if delete_user(db, user_id, batch_size=batch_size, progress=progress) is None:
+            raise ValueError("User not found")
+        _update_job(job_id, status="completed", finished_at=datetime.datetime.utcnow())
+    except Exception as e:
+        print(f"Deletion job {job_id} for user {user_id} failed: {e}")
+        db.rollback()
+        _update_job(job_id, status="failed", error=str(e), finished_at=datetime.datetime.utcnow())
+    finally:
+        db.close()
+
+def shutdown():
+    """Stops the deletion thread; a batch in progress still commits. Called when the application shuts down."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
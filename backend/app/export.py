@@ -0,0 +1,153 @@
+import io
+import csv
+import json
+import datetime
+from decimal import Decimal
+from sqlalchemy import select
+from . import crud, models
+from .database import SessionLocal
+
+EXPORT_BATCH_SIZE = 1000
+# One row per item; receipts without items get one row with empty item columns. The CSV
+# layout is the one bulk_import.read_csv accepts, so exports can be imported again.
+RECEIPT_COLUMNS = ("receipt_ref", "seller_name", "category", "receipt_date", "upload_date", "total_amount", "tax_amount")
+ITEM_COLUMNS = ("item_name", "quantity", "rate", "subtotal")
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _columns(include_owner: bool):
+    owner = ("owner_email",) if include_owner else ()
+    return RECEIPT_COLUMNS[:1] + owner + RECEIPT_COLUMNS[1:] + ITEM_COLUMNS
+
+def _export_select(user_id: int = None, start_date: datetime.date = None, end_date: datetime.date = None,
+                   category: str = None, seller: str = None):
+    query = (
+        select(
+            models.Receipt.id.label("receipt_ref"), models.Receipt.owner_email, models.Receipt.seller_name,
+            models.Receipt.category, models.Receipt.receipt_date, models.Receipt.upload_date,
+            models.Receipt.total_amount, models.Receipt.tax_amount,
+            models.Item.item_name, models.Item.quantity, models.Item.rate, models.Item.subtotal,
+        )
+        .outerjoin(models.Item, models.Item.receipt_id == models.Receipt.id)
+    )
+    if user_id is not None:
+        query = query.where(models.Receipt.owner_id == user_id)
+    query = crud.filter_receipts(query, start_date=start_date, end_date=end_date, category=category, seller=seller)
+    # Items of a receipt must arrive together for the NDJSON grouping.
+    return query.order_by(models.Receipt.upload_date.desc(), models.Receipt.id.desc(), models.Item.id)
+
+def iter_rows(user_id: int = None, batch_size: int = EXPORT_BATCH_SIZE, **filters):
+    """
+    Yields lists of up to batch_size row mappings, streamed from a server-side cursor
+    so memory stays flat however many receipts are exported. Uses its own session,
+    since the response body is produced after the request handler has returned.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(_export_select(user_id, **filters).execution_options(yield_per=batch_size))
+        for partition in result.mappings().partitions():
+            yield partition
+    finally:
+        db.close()
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+def csv_chunks(batches, include_owner: bool = False):
+    columns = _columns(include_owner)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # A BOM lets Excel detect UTF-8 for Japanese seller and item names.
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row[column] for column in columns] for row in batch)
+        yield buffer.getvalue()
+
+def ndjson_chunks(batches, include_owner: bool = False):
+    """Yields one JSON line per receipt with its items nested, as bulk_import.read_json expects."""
+    receipt_columns = _columns(include_owner)[:-len(ITEM_COLUMNS)]
+    current = None
+    for batch in batches:
+        lines = []
+        for row in batch:
+            if current is None or current["receipt_ref"] != row["receipt_ref"]:
+                if current is not None:
+                    lines.append(json.dumps(current, ensure_ascii=False))
+                current = {column: _plain(row[column]) for column in receipt_columns}
+                current["items"] = []
+            if row["item_name"] is not None:
+                current["items"].append({column: _plain(row[column]) for column in ITEM_COLUMNS})
+        if lines:
+            yield "\n".join(lines) + "\n"
+    if current is not None:
+        yield json.dumps(current, ensure_ascii=False) + "\n"
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file that hands out what was written so far, while tell() keeps counting."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def parquet_chunks(batches, include_owner: bool = False):
+    """Writes one Parquet row group per batch and yields the bytes as soon as each is complete."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "receipt_ref": pa.int64(), "owner_email": pa.string(), "seller_name": pa.string(), "category": pa.string(),
+        "receipt_date": pa.timestamp("us"), "upload_date": pa.timestamp("us"),
+        "total_amount": pa.float64(), "tax_amount": pa.float64(),
+        "item_name": pa.string(), "quantity": pa.int64(), "rate": pa.float64(), "subtotal": pa.float64(),
+    }
+    columns = _columns(include_owner)
+    schema = pa.schema([(column, types[column]) for column in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    yield sink.drain()
+    for batch in batches:
+        arrays = [[float(row[column]) if isinstance(row[column], Decimal) else row[column] for row in batch] for column in columns]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+WRITERS = {"csv": csv_chunks, "ndjson": ndjson_chunks, "parquet": parquet_chunks}
+
+def stream(export_format: str, user_id: int = None, include_owner: bool = False, **filters):
+    """
+    Returns an iterator over the encoded export; user_id=None exports every user's receipts.
+    Raises ImportError up front if the format needs a library that is not installed.
+    """
+    if export_format == "parquet":
+        import pyarrow.parquet  # noqa: F401
+    return WRITERS[export_format](iter_rows(user_id, **filters), include_owner=include_owner)
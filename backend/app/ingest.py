@@ -0,0 +1,485 @@
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import datetime
+import zipfile
+import tempfile
+import threading
+import contextvars
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from . import crud, schemas, cache, llm_utils, metrics
+from .database import SessionLocal
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+MAX_PENDING_JOBS = int(os.getenv("INGEST_MAX_PENDING", "100"))
+JOB_HISTORY_SIZE = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+BULK_PARALLELISM = int(os.getenv("BULK_PARALLELISM", str(OCR_WORKERS)))
+BULK_MAX_PARALLELISM = int(os.getenv("BULK_MAX_PARALLELISM", "32"))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "1000"))
+BULK_INSERT_BATCH = int(os.getenv("BULK_INSERT_BATCH", "50"))
+# Dedicated ingest workers set this to load the OCR and LLM backends at startup.
+INGEST_PRELOAD = os.getenv("INGEST_PRELOAD", "false").lower() == "true"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp", ".heic")
+
+FINISHED_STATUSES = ("completed", "duplicate", "failed")
+
+class UploadTooLarge(Exception):
+    pass
+
+# Jobs live in this process only: GET /api/receipts/jobs/{id} must reach the worker that
+# accepted the upload, so multi-worker deployments need a single worker or sticky routing.
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_tasks = set()
+_pools_lock = threading.Lock()
+_ocr_pool = None
+_llm_pool = None
+# Runs in the OCR process pool, so replacements must be picklable (defined at module level).
+# None stands for ocr_utils.extract_text_from_image, imported on first use so that workers
+# which never OCR an image do not load Tesseract and Pillow.
+ocr_function = None
+
+
+def _get_ocr_pool():
+    global _ocr_pool
+    with _pools_lock:
+        if _ocr_pool is None:
+            # Tesseract is CPU bound, so it gets real processes; "spawn" keeps the
+            # children from inheriting the server's threads and open DB connections.
+            _ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _ocr_pool
+
+def set_ocr_function(function):
+    """Swaps the OCR function, e.g. for an offline stub in benchmarks."""
+    global ocr_function
+    ocr_function = function
+
+def _get_ocr_function():
+    global ocr_function
+    if ocr_function is None:
+        from .ocr_utils import extract_text_from_image
+        ocr_function = extract_text_from_image
+    return ocr_function
+
+def warm_up():
+    """
+    Loads the OCR and LLM backends and starts the OCR processes ahead of the first upload.
+    Meant for dedicated ingest workers (INGEST_PRELOAD=true); API workers skip it.
+    """
+    _get_ocr_function()
+    llm_utils.warm_up()
+    pool = _get_ocr_pool()
+    for future in [pool.submit(_get_ocr_function) for _ in range(OCR_WORKERS)]:
+        future.result()
+
+def _get_llm_pool():
+    global _llm_pool
+    with _pools_lock:
+        if _llm_pool is None:
+            _llm_pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+        return _llm_pool
+
+def shutdown():
+    """Stops the worker pools. Called when the application shuts down."""
+    global _ocr_pool, _llm_pool
+    with _pools_lock:
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+            _ocr_pool = None
+        if _llm_pool is not None:
+            _llm_pool.shutdown(wait=False, cancel_futures=True)
+            _llm_pool = None
+
+
+def pending_count() -> int:
+    with _jobs_lock:
+        return sum(1 for job in _jobs.values() if job["status"] not in FINISHED_STATUSES)
+
+metrics.CallbackMetric("ingest_pending_jobs", "Upload jobs queued or in progress.", (), lambda: {(): pending_count()})
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job, stages=dict(job["stages"]), cache_hits=list(job["cache_hits"])) if job else None
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        _jobs[job_id].update(fields)
+
+def _record_stage(job_id: str, stage: str, started: float):
+    with _jobs_lock:
+        _jobs[job_id]["stages"][stage] = round(time.perf_counter() - started, 4)
+
+def _record_cache_hit(job_id: str, stage: str):
+    with _jobs_lock:
+        _jobs[job_id]["cache_hits"].append(stage)
+
+def _add_job(job: dict):
+    with _jobs_lock:
+        _jobs[job["id"]] = job
+        # Forget the oldest finished jobs once the history is full.
+        while len(_jobs) > JOB_HISTORY_SIZE:
+            oldest_id = next((jid for jid, j in _jobs.items() if j["status"] in FINISHED_STATUSES), None)
+            if oldest_id is None:
+                break
+            del _jobs[oldest_id]
+
+
+async def save_upload(file) -> tuple:
+    """
+    Streams an UploadFile into a uniquely named temp file in chunks, hashing it on the way.
+    Returns (path, sha256 digest). Raises UploadTooLarge past MAX_UPLOAD_BYTES.
+    """
+    loop = asyncio.get_running_loop()
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="receipt_", suffix=suffix)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with metrics.stage("read_file"), os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit.")
+                digest.update(chunk)
+                await loop.run_in_executor(None, buffer.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+def remove_files(paths):
+    """Deletes temp files, skipping any that are already gone."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _store_receipts(parsed_list: list, user_id: int, user_email: str, allow_duplicate: bool) -> list:
+    """
+    Validates the parsed receipts and inserts the valid, non-duplicate ones in one transaction.
+    A receipt repeated within parsed_list is a duplicate of its first copy.
+    Returns one {"receipt_id", "duplicate_of", "error"} dict per input, in order.
+    """
+    outcomes = [{"receipt_id": None, "duplicate_of": None, "error": None} for _ in parsed_list]
+    to_create = []
+    # (seller, date, total) -> outcome of the first copy in this batch, and (outcome, first) of later copies.
+    firsts, copies = {}, []
+    # Only the new ids are read after the commit, so there is no need to reload every row.
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        for outcome, parsed_data in zip(outcomes, parsed_list):
+            try:
+                with metrics.stage("validate"):
+                    receipt = schemas.ReceiptCreate(**parsed_data)
+            except Exception as e:
+                outcome["error"] = f"Validation error for Gemini's output: {e}"
+                continue
+            if not allow_duplicate:
+                duplicate = crud.find_duplicate_receipt(db, receipt=receipt, user_id=user_id)
+                if duplicate:
+                    outcome["duplicate_of"] = duplicate.id
+                    continue
+                key = (receipt.seller_name, receipt.receipt_date, receipt.total_amount)
+                if key in firsts:
+                    copies.append((outcome, firsts[key]))
+                    continue
+                firsts[key] = outcome
+            to_create.append((outcome, receipt))
+        if to_create:
+            try:
+                with metrics.stage("store"):
+                    created = crud.create_receipts(db=db, receipts=[receipt for _, receipt in to_create], user_id=user_id, user_email=user_email)
+            except Exception as e:
+                for outcome, _ in to_create:
+                    outcome["error"] = f"Could not save the receipt: {e}"
+            else:
+                for (outcome, _), db_receipt in zip(to_create, created):
+                    outcome["receipt_id"] = db_receipt.id
+        for outcome, first in copies:
+            outcome["duplicate_of"], outcome["error"] = first["receipt_id"], first["error"]
+        return outcomes
+    finally:
+        db.close()
+
+async def _read_text(image_path: str, image_digest: str) -> tuple:
+    """OCRs the image, or takes the text from the cache. Deletes image_path. Returns (text, cache_hit)."""
+    try:
+        ocr_text = cache.ocr_cache.get(image_digest)
+        if ocr_text is not None:
+            metrics.ocr_calls.inc(outcome="cache_hit")
+            return ocr_text, True
+        loop = asyncio.get_running_loop()
+        try:
+            with metrics.stage("ocr"):
+                ocr_text = await loop.run_in_executor(_get_ocr_pool(), _get_ocr_function(), image_path)
+        except Exception as e:
+            metrics.ocr_calls.inc(outcome="failed")
+            raise ValueError(f"OCR failed to read the image: {e}") from e
+        if ocr_text.strip():
+            metrics.ocr_calls.inc(outcome="ok")
+            cache.ocr_cache.set(image_digest, ocr_text)
+        else:
+            metrics.ocr_calls.inc(outcome="empty")
+        return ocr_text, False
+    finally:
+        os.remove(image_path)
+
+async def _parse_text(ocr_text: str) -> tuple:
+    """Parses OCR text through the cache and the parser chain. Returns (data, parser name)."""
+    text_digest = cache.hash_ocr_text(ocr_text)
+    parsed_data = cache.parse_cache.get(text_digest)
+    if parsed_data is not None:
+        metrics.parser_results.inc(parser="cache")
+        return parsed_data, "cache"
+    with metrics.stage("parse"):
+        parsed_data, parser_name = await llm_utils.parse_receipt_async(ocr_text, executor=_get_llm_pool())
+    metrics.parser_results.inc(parser=parser_name or "none")
+    if parsed_data:
+        cache.parse_cache.set(text_digest, parsed_data)
+    return parsed_data, parser_name
+
+
+def submit_job(image_path: str, image_digest: str, filename: str, user_id: int, user_email: str, allow_duplicate: bool = False) -> dict:
+    """
+    Queues a saved receipt image for OCR, parsing and storage, and returns the new job.
+    The job takes ownership of image_path and deletes it after OCR.
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "owner_id": user_id,
+        "status": "queued",
+        "filename": filename,
+        "created_at": datetime.datetime.utcnow(),
+        "started_at": None,
+        "finished_at": None,
+        "stages": {},
+        "cache_hits": [],
+        "parser": None,
+        "receipt_id": None,
+        "duplicate_of": None,
+        "error": None,
+    }
+    _add_job(job)
+    # A fresh context keeps the job's spans out of the upload request's slow-request breakdown.
+    task = asyncio.create_task(_run_job(job["id"], image_path, image_digest, user_id, user_email, allow_duplicate), context=contextvars.Context())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return get_job(job["id"])
+
+async def _run_job(job_id: str, image_path: str, image_digest: str, user_id: int, user_email: str, allow_duplicate: bool):
+    loop = asyncio.get_running_loop()
+    _update_job(job_id, status="ocr", started_at=datetime.datetime.utcnow())
+    try:
+        started = time.perf_counter()
+        ocr_text, cache_hit = await _read_text(image_path, image_digest)
+        if cache_hit:
+            _record_cache_hit(job_id, "ocr")
+        _record_stage(job_id, "ocr", started)
+        if not ocr_text.strip():
+            raise ValueError("OCR failed to extract any text from the image.")
+
+        _update_job(job_id, status="parsing")
+        started = time.perf_counter()
+        parsed_data, parser_name = await _parse_text(ocr_text)
+        if parser_name == "cache":
+            _record_cache_hit(job_id, "parse")
+        _record_stage(job_id, "parse", started)
+        _update_job(job_id, parser=parser_name)
+        if not parsed_data:
+            raise ValueError("Gemini failed to parse the receipt text.")
+
+        _update_job(job_id, status="saving")
+        started = time.perf_counter()
+        outcome = (await loop.run_in_executor(None, _store_receipts, [parsed_data], user_id, user_email, allow_duplicate))[0]
+        _record_stage(job_id, "store", started)
+        if outcome["error"]:
+            raise ValueError(outcome["error"])
+
+        llm_utils.learn_seller_template(ocr_text, parsed_data, parser_name)
+        if outcome["duplicate_of"] is not None:
+            _update_job(job_id, status="duplicate", duplicate_of=outcome["duplicate_of"], finished_at=datetime.datetime.utcnow())
+        else:
+            _update_job(job_id, status="completed", receipt_id=outcome["receipt_id"], finished_at=datetime.datetime.utcnow())
+    except Exception as e:
+        print(f"Receipt ingest job {job_id} failed: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=datetime.datetime.utcnow())
+
+
+# --- Bulk uploads ---
+
+def _extract_zip_member(archive_path: str, member) -> tuple:
+    """Copies one archive member into its own temp file. Returns (path, sha256 digest)."""
+    fd, path = tempfile.mkstemp(prefix="receipt_", suffix=os.path.splitext(member.filename)[1])
+    digest = hashlib.sha256()
+    try:
+        with zipfile.ZipFile(archive_path) as archive, archive.open(member) as source, os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+def _discard_extraction(future):
+    if not future.cancelled() and future.exception() is None:
+        remove_files([future.result()[0]])
+
+async def _iter_bulk_sources(saved_files: list):
+    """
+    Yields (filename, path, digest, error) for every image in the saved uploads, expanding
+    ZIP archives one member at a time so only the images being worked on sit on disk.
+    The caller owns the yielded paths; saved files not reached when the generator is closed
+    early are deleted.
+    """
+    loop = asyncio.get_running_loop()
+    count = 0
+    reached = 0
+    try:
+        for filename, path, digest in saved_files:
+            reached += 1
+            if not zipfile.is_zipfile(path):
+                count += 1
+                if count > BULK_MAX_FILES:
+                    os.remove(path)
+                    yield filename, None, None, f"Bulk uploads are limited to {BULK_MAX_FILES} images."
+                    continue
+                yield filename, path, digest, None
+                continue
+            try:
+                with zipfile.ZipFile(path) as archive:
+                    members = [m for m in archive.infolist() if not m.is_dir() and os.path.splitext(m.filename)[1].lower() in IMAGE_EXTENSIONS]
+                for member in members:
+                    name = f"{filename}/{member.filename}"
+                    count += 1
+                    if count > BULK_MAX_FILES:
+                        yield name, None, None, f"Bulk uploads are limited to {BULK_MAX_FILES} images."
+                    elif member.file_size > MAX_UPLOAD_BYTES:
+                        yield name, None, None, f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit."
+                    else:
+                        extraction = loop.run_in_executor(None, _extract_zip_member, path, member)
+                        try:
+                            member_path, member_digest = await asyncio.shield(extraction)
+                        except asyncio.CancelledError:
+                            # The copy carries on in its thread; delete it once it is written.
+                            extraction.add_done_callback(_discard_extraction)
+                            raise
+                        yield name, member_path, member_digest, None
+            except zipfile.BadZipFile as e:
+                yield filename, None, None, f"Could not read the archive: {e}"
+            finally:
+                os.remove(path)
+    finally:
+        remove_files(path for _, path, _ in saved_files[reached:])
+
+async def _process_bulk_file(filename: str, path: str, digest: str) -> dict:
+    result = {"filename": filename, "status": "failed", "parser": None, "receipt_id": None, "duplicate_of": None, "error": None}
+    try:
+        ocr_text, _ = await _read_text(path, digest)
+        if not ocr_text.strip():
+            raise ValueError("OCR failed to extract any text from the image.")
+        parsed_data, result["parser"] = await _parse_text(ocr_text)
+        if not parsed_data:
+            raise ValueError("Gemini failed to parse the receipt text.")
+        result["ocr_text"], result["parsed_data"] = ocr_text, parsed_data
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+async def process_bulk(saved_files: list, user_id: int, user_email: str, parallelism: int = BULK_PARALLELISM, allow_duplicate: bool = False):
+    """
+    Runs OCR and parsing for a bulk upload with at most `parallelism` images in flight and
+    yields one result dict per image as it finishes. Parsed receipts are inserted in batches
+    of up to BULK_INSERT_BATCH per transaction; a batch is written as soon as no other
+    result is ready, so results are never held back waiting for a full batch.
+
+    saved_files is a list of (filename, path, digest) from save_upload; the paths are deleted,
+    including when the client disconnects or the upload is cancelled part way.
+    """
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(parallelism)
+    workers = set()
+    # Images taken from the sources whose worker has not finished reading them yet.
+    unread = set()
+
+    async def work(filename, path, digest):
+        try:
+            result = await _process_bulk_file(filename, path, digest)
+            unread.discard(path)
+            await results.put(result)
+        finally:
+            slots.release()
+
+    async def produce():
+        sources = _iter_bulk_sources(saved_files)
+        try:
+            async for filename, path, digest, error in sources:
+                if error:
+                    await results.put({"filename": filename, "status": "failed", "parser": None, "receipt_id": None, "duplicate_of": None, "error": error})
+                    continue
+                unread.add(path)
+                await slots.acquire()
+                worker = asyncio.create_task(work(filename, path, digest))
+                workers.add(worker)
+                worker.add_done_callback(workers.discard)
+        finally:
+            await sources.aclose()
+        while workers:
+            await asyncio.gather(*list(workers))
+        await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    pending = []
+
+    async def flush():
+        outcomes = await loop.run_in_executor(None, _store_receipts, [r["parsed_data"] for r in pending], user_id, user_email, allow_duplicate)
+        flushed = []
+        for result, outcome in zip(pending, outcomes):
+            result.update(outcome)
+            if outcome["error"]:
+                result["status"] = "failed"
+            else:
+                llm_utils.learn_seller_template(result["ocr_text"], result["parsed_data"], result["parser"])
+                result["status"] = "duplicate" if outcome["duplicate_of"] is not None else "completed"
+            del result["ocr_text"], result["parsed_data"]
+            flushed.append(result)
+        pending.clear()
+        return flushed
+
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            if "parsed_data" in result:
+                pending.append(result)
+            else:
+                yield result
+            if pending and (len(pending) >= BULK_INSERT_BATCH or results.empty()):
+                for flushed in await flush():
+                    yield flushed
+        if pending:
+            for flushed in await flush():
+                yield flushed
+    finally:
+        producer.cancel()
+        for worker in list(workers):
+            worker.cancel()
+        await asyncio.gather(producer, *list(workers), return_exceptions=True)
+        remove_files(unread)
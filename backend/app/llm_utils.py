@@ -1,23 +1,67 @@
 import os
-import google.generativeai as genai
+import re
+import time
+import random
+import asyncio
+import threading
 from dotenv import load_dotenv
 import json
+from . import cache, schemas, metrics
 
 load_dotenv()
 
-try:
-    genai.configure(api_key=os.environ['GOOGLE_API_KEY'])
-except KeyError:
-    print("Error: GOOGLE_API_KEY environment variable not set.")
-    exit()
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+LOCAL_PARSER_THRESHOLD = float(os.getenv("LOCAL_PARSER_THRESHOLD", "0.8"))
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "200"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
 
-model = genai.GenerativeModel('gemini-1.5-flash')
 
-def parse_receipt_with_gemini(ocr_text: str) -> dict:
+class GeminiClient:
     """
-    Sends the OCR-extracted receipt text to Gemini and returns a structured dictionary.
+    The default LLM client. Anything with a generate(prompt) -> str method can replace it.
+    The Gemini SDK is imported and configured on first use, so API workers that never parse
+    a receipt do not pay for it and can start without GOOGLE_API_KEY.
     """
-    prompt = f"""
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GOOGLE_API_KEY environment variable not set.")
+                import google.generativeai as genai
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt: str) -> str:
+        return self.model.generate_content(prompt).text
+
+llm_client = GeminiClient()
+
+def set_llm_client(client):
+    """Swaps the LLM client, e.g. for an offline stub in benchmarks."""
+    global llm_client, _batcher
+    llm_client = client
+    _batcher = None
+
+def warm_up():
+    """Loads the Gemini SDK now rather than on the first receipt, if the default client is in use."""
+    if isinstance(llm_client, GeminiClient):
+        llm_client.model
+
+
+PROMPT_INSTRUCTIONS = """
 You are an expert AI assistant that extracts structured data from OCR text of a receipt. The text may be in English or Japanese.
 
 Your instructions are:
@@ -32,7 +76,36 @@ Extract the following fields and return the result in a valid JSON format with E
 - items (a list of objects, each with item_name, quantity, rate, and subtotal)
 - total_amount
 - tax_amount
+"""
+
+def _generate_with_retry(prompt: str) -> str:
+    """Calls the LLM client, retrying failures with capped exponential backoff and full jitter."""
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            response_text = llm_client.generate(prompt).strip()
+        except Exception as e:
+            metrics.llm_calls.inc(outcome="failed")
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt))
+            print(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+        else:
+            metrics.llm_calls.inc(outcome="ok")
+            return response_text
 
+def _extract_json(response_text: str, opening: str, closing: str):
+    json_start = response_text.find(opening)
+    json_end = response_text.rfind(closing) + 1
+    if json_start == -1 or json_end == 0:
+        return None
+    return json.loads(response_text[json_start:json_end])
+
+def parse_receipt_with_gemini(ocr_text: str) -> dict:
+    """
+    Sends the OCR-extracted receipt text to Gemini and returns a structured dictionary.
+    """
+    prompt = f"""{PROMPT_INSTRUCTIONS}
 IMPORTANT: Your entire output must be only the raw JSON object. Do not include any other text or explanations.
 
 Receipt Text:
@@ -41,21 +114,328 @@ Receipt Text:
 \"\"\"
 """
 
+    response_text = ""
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}') + 1
-
-        if json_start != -1 and json_end != 0:
-            json_string = response_text[json_start:json_end]
-            return json.loads(json_string)
-        else:
+        response_text = _generate_with_retry(prompt)
+        data = _extract_json(response_text, '{', '}')
+        if data is None:
             print("Error: Could not find a valid JSON object in the AI response.")
             return {}
-            
+        return data
+
     except Exception as e:
         print(f"Error parsing receipt with Gemini: {e}")
         print(f"Full AI Response was: {response_text}")
-        return {}
\ No newline at end of file
+        return {}
+
+
+# --- Batched parsing ---
+
+def _is_valid_receipt(data) -> bool:
+    try:
+        schemas.ReceiptCreate(**data)
+        return True
+    except Exception:
+        return False
+
+def parse_receipts_batch(ocr_texts: list) -> list:
+    """
+    Parses several receipts with one Gemini request that returns a JSON array.
+    Results come back in input order; receipts missing from the answer or failing
+    schemas.ReceiptCreate validation are retried on their own, and an empty dict
+    stands for a receipt that could not be parsed.
+    """
+    if len(ocr_texts) == 1:
+        return [parse_receipt_with_gemini(ocr_texts[0])]
+
+    receipts_block = "\n".join(f'### RECEIPT {index}\n\"\"\"\n{text}\n\"\"\"' for index, text in enumerate(ocr_texts))
+    prompt = f"""{PROMPT_INSTRUCTIONS}
+You are given {len(ocr_texts)} receipts below, each introduced by a "### RECEIPT <index>" line.
+Return a JSON array with exactly one object per receipt. Each object must also contain an "index" field with the receipt's index.
+
+IMPORTANT: Your entire output must be only the raw JSON array. Do not include any other text or explanations.
+
+{receipts_block}
+"""
+
+    results = [None] * len(ocr_texts)
+    response_text = ""
+    try:
+        response_text = _generate_with_retry(prompt)
+        parsed = _extract_json(response_text, '[', ']') or []
+        for position, data in enumerate(parsed):
+            if not isinstance(data, dict):
+                continue
+            index = data.pop("index", position)
+            if isinstance(index, int) and 0 <= index < len(results) and _is_valid_receipt(data):
+                results[index] = data
+    except Exception as e:
+        # Retrying every receipt on its own would only pile more load onto a failing service.
+        print(f"Error parsing receipt batch with Gemini: {e}")
+        print(f"Full AI Response was: {response_text}")
+        return [{} for _ in ocr_texts]
+
+    return [data if data is not None else parse_receipt_with_gemini(text) for data, text in zip(results, ocr_texts)]
+
+
+class ReceiptBatcher:
+    """
+    Collects receipts parsed from concurrent coroutines and sends them to Gemini together,
+    once LLM_BATCH_SIZE are waiting or LLM_BATCH_WINDOW_MS has passed, whichever comes first.
+    At most LLM_MAX_IN_FLIGHT batch requests run at the same time.
+    """
+
+    def __init__(self, batch_size=LLM_BATCH_SIZE, window_ms=LLM_BATCH_WINDOW_MS, max_in_flight=LLM_MAX_IN_FLIGHT, executor=None):
+        self.batch_size = batch_size
+        self.window = window_ms / 1000
+        self.executor = executor
+        self.batches_sent = 0
+        self._pending = []
+        self._flush_handle = None
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+
+    async def parse(self, ocr_text: str) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((ocr_text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            self.batches_sent += 1
+            try:
+                results = await loop.run_in_executor(self.executor, parse_receipts_batch, [text for text, _ in batch])
+            except Exception as e:
+                print(f"Error parsing receipt batch with Gemini: {e}")
+                results = [{}] * len(batch)
+        for (_, future), data in zip(batch, results):
+            if not future.done():
+                future.set_result(data)
+
+_batcher = None
+
+def get_batcher(executor=None) -> ReceiptBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = ReceiptBatcher(executor=executor)
+    return _batcher
+
+
+# --- Local fast-path parser ---
+
+_AMOUNT = r"[¥￥\\]?\s*(-?\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|-?\d+(?:\.\d{1,2})?)"
+_TRAILING_MARKS = r"\s*[A-Z軽※*＊]?\s*[)）]?\s*$"
+_TOTAL_LINE = re.compile(r"(合\s*計|お買上計|お買上げ計|総合計|GRAND\s*TOTAL|TOTAL|AMOUNT\s*DUE)", re.IGNORECASE)
+_SUBTOTAL_LINE = re.compile(r"(小\s*計|SUB\s*-?\s*TOTAL|対象|点数)", re.IGNORECASE)
+_TAX_LINE = re.compile(r"(消費税|内税|外税|税額|\bTAX\b|\bVAT\b)", re.IGNORECASE)
+_TAX_EXCLUDE = re.compile(r"(対象|TAXABLE|税込|合\s*計|TOTAL)", re.IGNORECASE)
+_SKIP_LINE = re.compile(
+    r"(お預り|お預かり|預り|お釣|釣銭|おつり|現金|クレジット|ポイント|電話|TEL|CASH|CHANGE|CARD|VISA|MASTER|BALANCE|No\.|レジ|登録番号)",
+    re.IGNORECASE,
+)
+_DATE = re.compile(r"(20\d{2})\s*[/\-.年]\s*(\d{1,2})\s*[/\-.月]\s*(\d{1,2})\s*日?")
+_REIWA_DATE = re.compile(r"令和\s*(\d{1,2}|元)\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日")
+_TIME = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?")
+_ITEM_WITH_QTY = re.compile(r"^(?P<name>.*?\S)\s+(?P<qty>\d{1,3})\s*[x×X@*]\s*" + _AMOUNT + r"\s+" + _AMOUNT + _TRAILING_MARKS)
+_ITEM = re.compile(r"^(?P<name>.*?\S)\s+" + _AMOUNT + _TRAILING_MARKS)
+_HAS_WORD = re.compile(r"[A-Za-z぀-ヿ一-鿿]{2,}")
+
+_CATEGORY_KEYWORDS = {
+    "Fuel": ["ENEOS", "出光", "SHELL", "コスモ石油", "ガソリン", "GASOLINE"],
+    "Dining Out": ["RESTAURANT", "CAFE", "COFFEE", "STARBUCKS", "食堂", "レストラン", "カフェ", "居酒屋", "ラーメン", "マクドナルド", "すき家", "吉野家"],
+    "Groceries": ["SUPERMARKET", "GROCERY", "MARKET", "スーパー", "イオン", "西友", "ライフ", "マルエツ", "ローソン", "ファミリーマート", "セブン"],
+    "Travel": ["HOTEL", "AIRLINE", "TAXI", "ホテル", "旅館", "タクシー", "JR"],
+    "Utilities": ["ELECTRIC", "WATER", "電気", "水道", "ガス料金"],
+    "Entertainment": ["CINEMA", "THEATER", "KARAOKE", "映画", "カラオケ"],
+    "Shopping": ["UNIQLO", "ユニクロ", "DAISO", "ダイソー", "無印", "ヨドバシ", "ビックカメラ"],
+}
+
+# Seller name and category of previously accepted receipts, keyed by their header line.
+seller_templates = cache.make_cache("seller")
+metrics.register_cache("seller", seller_templates.stats)
+
+
+def _to_amount(text: str) -> float:
+    return float(text.replace(",", ""))
+
+def _template_key(line: str) -> str:
+    return cache.normalize_ocr_text(line).casefold()
+
+def _find_amount_at_end(line: str):
+    match = re.search(_AMOUNT + _TRAILING_MARKS, line)
+    return _to_amount(match.group(1)) if match else None
+
+def _find_date(text: str):
+    match = _DATE.search(text)
+    if match:
+        year, month, day = (int(v) for v in match.groups())
+    else:
+        match = _REIWA_DATE.search(text)
+        if not match:
+            return None
+        era_year = 1 if match.group(1) == "元" else int(match.group(1))
+        year, month, day = 2018 + era_year, int(match.group(2)), int(match.group(3))
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    hour = minute = second = 0
+    time_match = _TIME.search(text, match.end())
+    if time_match and int(time_match.group(1)) < 24:
+        hour, minute = int(time_match.group(1)), int(time_match.group(2))
+        second = int(time_match.group(3) or 0)
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}"
+
+def _guess_category(text: str):
+    upper = text.upper()
+    for category, keywords in _CATEGORY_KEYWORDS.items():
+        if any(keyword.upper() in upper for keyword in keywords):
+            return category
+    return None
+
+def learn_seller_template(ocr_text: str, parsed_data: dict, parser_name: str):
+    """
+    Remembers the seller and category of an accepted receipt for the local parser.
+    Only results of a remote parser are learned: a template learned from the local parser's
+    own guess would raise its confidence for the next receipt of that seller.
+    """
+    if not any(parser["name"] == parser_name and parser["remote"] for parser in PARSER_CHAIN):
+        return
+    lines = cache.normalize_ocr_text(ocr_text).splitlines()
+    if not lines or not parsed_data.get("seller_name") or not parsed_data.get("category"):
+        return
+    seller_templates.set(_template_key(lines[0]), {"seller_name": parsed_data["seller_name"], "category": parsed_data["category"]})
+
+def parse_receipt_locally(ocr_text: str):
+    """
+    Parses formulaic English and Japanese receipts with regexes and layout heuristics.
+    Returns (data, confidence) where confidence is between 0 and 1.
+    """
+    lines = cache.normalize_ocr_text(ocr_text).splitlines()
+    if not lines:
+        return {}, 0.0
+
+    confidence = 0.0
+    totals, taxes, items = [], [], []
+    for line in lines:
+        if _TOTAL_LINE.search(line) and not _SUBTOTAL_LINE.search(line):
+            amount = _find_amount_at_end(line)
+            if amount is not None:
+                totals.append(amount)
+            continue
+        if _TAX_LINE.search(line):
+            amount = _find_amount_at_end(line)
+            if amount is not None and not _TAX_EXCLUDE.search(line):
+                taxes.append(amount)
+            continue
+        if _SUBTOTAL_LINE.search(line) or _SKIP_LINE.search(line) or _DATE.search(line):
+            continue
+        match = _ITEM_WITH_QTY.match(line)
+        if match:
+            name, quantity, rate, subtotal = match.group("name"), int(match.group("qty")), _to_amount(match.group(3)), _to_amount(match.group(4))
+        else:
+            match = _ITEM.match(line)
+            if not match:
+                continue
+            name, quantity, subtotal = match.group("name"), 1, _to_amount(match.group(2))
+            rate = subtotal
+        if _HAS_WORD.search(name):
+            items.append({"item_name": name, "quantity": quantity, "rate": rate, "subtotal": subtotal})
+
+    total = max(totals) if totals else None
+    tax = sum(taxes) if taxes else None
+    receipt_date = _find_date("\n".join(lines))
+
+    template = None
+    for line in lines[:3]:
+        template = seller_templates.get(_template_key(line))
+        if template:
+            break
+    if template:
+        seller_name, category = template["seller_name"], template["category"]
+        confidence += 0.2
+    else:
+        seller_name = next((line for line in lines[:3] if _HAS_WORD.search(line)), lines[0])
+        category = _guess_category("\n".join(lines[:5]))
+        if category:
+            confidence += 0.1
+        else:
+            category = "Other"
+
+    if total is not None:
+        confidence += 0.3
+    if receipt_date:
+        confidence += 0.2
+    if total is not None and items:
+        items_sum = sum(item["subtotal"] for item in items)
+        # Item rows may be listed with or without tax.
+        if abs(items_sum - total) <= 1 or (tax is not None and abs(items_sum + tax - total) <= 1):
+            confidence += 0.3
+
+    # Without a known seller or a category keyword the seller and category are guesses, so the
+    # result is left to the next parser however well the amounts reconcile.
+    if total is None or not receipt_date or category == "Other" and not template:
+        return {}, round(confidence, 2)
+    return {
+        "seller_name": seller_name,
+        "category": category,
+        "receipt_date": receipt_date,
+        "items": items,
+        "total_amount": total,
+        "tax_amount": tax,
+    }, round(confidence, 2)
+
+
+# --- Parser chain ---
+
+def _parse_with_gemini(ocr_text: str):
+    data = parse_receipt_with_gemini(ocr_text)
+    return data, 1.0 if data else 0.0
+
+async def _parse_with_gemini_batched(ocr_text: str, executor=None):
+    data = await get_batcher(executor).parse(ocr_text)
+    return data, 1.0 if data else 0.0
+
+# Tried in order; a parser's result is used when its confidence reaches its threshold.
+# In parse_receipt_async, "parse_async" is awaited when present and other remote
+# parsers are run in the executor.
+PARSER_CHAIN = [
+    {"name": "local", "parse": parse_receipt_locally, "threshold": LOCAL_PARSER_THRESHOLD, "remote": False},
+    {"name": "gemini", "parse": _parse_with_gemini, "parse_async": _parse_with_gemini_batched, "threshold": 0.0, "remote": True},
+]
+
+def parse_receipt(ocr_text: str):
+    """Runs the parser chain and returns (data, name of the parser that handled it)."""
+    for parser in PARSER_CHAIN:
+        data, confidence = parser["parse"](ocr_text)
+        if data and confidence >= parser["threshold"]:
+            return data, parser["name"]
+    return {}, None
+
+async def parse_receipt_async(ocr_text: str, executor=None):
+    """Like parse_receipt, but runs remote parsers in the given executor instead of blocking."""
+    loop = asyncio.get_running_loop()
+    for parser in PARSER_CHAIN:
+        if "parse_async" in parser:
+            data, confidence = await parser["parse_async"](ocr_text, executor)
+        elif parser["remote"]:
+            data, confidence = await loop.run_in_executor(executor, parser["parse"], ocr_text)
+        else:
+            data, confidence = parser["parse"](ocr_text)
+        if data and confidence >= parser["threshold"]:
+            return data, parser["name"]
+    return {}, None
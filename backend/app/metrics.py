@@ -0,0 +1,296 @@
+import os
+import re
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Requests slower than this are printed with their spans and queries; 0 turns the log off.
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+SLOW_REQUEST_MAX_QUERIES = int(os.getenv("SLOW_REQUEST_MAX_QUERIES", "10"))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+# The slow-request breakdown of the current request, and the span queries are attributed to.
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _quote(value) -> str:
+    return '"' + _escape(value) + '"'
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f"{name}={_quote(value)}" for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: [str(v) for v in item[0]])
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values)
+        return lines
+
+
+class Histogram:
+    """Per label set: a count per bucket (made cumulative when rendered), the sum and the count."""
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self) -> list:
+        with self._lock:
+            values = sorted(((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()),
+                            key=lambda item: [str(v) for v in item[0]])
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, 'le=' + _quote(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, 'le=' + _quote('+Inf'))} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """A gauge (or counter kept elsewhere) read at scrape time; callback returns {label values: value}."""
+
+    def __init__(self, name: str, help_text: str, labelnames, callback, kind: str = "gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+        _registry.append(self)
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"Could not collect metric {self.name}: {e}")
+            return lines
+        lines.extend(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items()))
+        return lines
+
+
+def render() -> str:
+    """Returns every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+request_seconds = Histogram("http_request_duration_seconds", "Time to serve a request, including streaming the body.", ("method", "route"))
+requests_total = Counter("http_requests_total", "Requests served.", ("method", "route", "status"))
+stage_seconds = Histogram("ingest_stage_duration_seconds", "Time spent in each receipt ingest stage.", ("stage",))
+crud_seconds = Histogram("crud_duration_seconds", "Time spent in each crud function, queries and commits included.", ("function",))
+query_seconds = Histogram("db_query_duration_seconds", "Time spent executing SQL statements, by statement type and calling span.", ("engine", "operation", "span"))
+ocr_calls = Counter("ocr_calls_total", "OCR lookups by outcome: ok, empty, failed or cache_hit.", ("outcome",))
+llm_calls = Counter("llm_calls_total", "LLM API calls by outcome (each retry is a call).", ("outcome",))
+parser_results = Counter("receipt_parser_results_total", "Parsed receipts by the parser that produced them (none when all failed).", ("parser",))
+
+
+# --- Spans ---
+
+@contextmanager
+def span(name: str, histogram=None, **labels):
+    """
+    Times the block into histogram (if given) and into the current request's slow-request
+    breakdown. SQL statements run inside the block are attributed to the span.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    token = _current_span.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_span.reset(token)
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace["spans"].append((name, elapsed))
+
+def stage(name: str):
+    """A span for one ingest stage (read_file, ocr, parse, validate, store)."""
+    return span(f"ingest.{name}", stage_seconds, stage=name)
+
+def timed(function):
+    """Decorates a crud function so every call is a span named after it."""
+    name = function.__name__
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with span(f"crud.{name}", crud_seconds, function=name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# --- Database ---
+
+_pools = {}
+
+def instrument_engine(engine, name: str):
+    """Times every statement run through the (sync) engine and exports its pool usage."""
+    _pools[name] = engine.pool
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute(name))
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(engine_name: str):
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None or not METRICS_ENABLED:
+            return
+        elapsed = time.perf_counter() - started
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        current = _current_span.get() or "none"
+        query_seconds.observe(elapsed, engine=engine_name, operation=operation, span=current)
+        trace = _trace.get()
+        if trace is not None:
+            trace["queries"].append((elapsed, current, statement))
+    return listener
+
+def _pool_connections() -> dict:
+    values = {}
+    for name, pool in _pools.items():
+        for state in ("checkedout", "checkedin", "overflow", "size"):
+            method = getattr(pool, state, None)
+            if method is not None:
+                # QueuePool.overflow() counts down from -pool_size while the pool is not full.
+                values[(name, state)] = max(0, method())
+    return values
+
+CallbackMetric("db_pool_connections", "Connection pool usage: checked out, idle (checkedin), overflow and configured size.", ("engine", "state"), _pool_connections)
+
+
+# --- Caches ---
+
+_caches = {}
+
+def register_cache(name: str, stats):
+    """Exports hit and miss counts for a cache; stats() returns a dict with "hits" and "misses"."""
+    _caches[name] = stats
+
+def _cache_values(field: str) -> dict:
+    return {(name,): stats().get(field, 0) for name, stats in _caches.items()}
+
+def _cache_hit_ratio() -> dict:
+    ratios = {}
+    for name, stats in _caches.items():
+        values = stats()
+        lookups = values.get("hits", 0) + values.get("misses", 0)
+        ratios[(name,)] = values.get("hits", 0) / lookups if lookups else 0.0
+    return ratios
+
+CallbackMetric("cache_hits_total", "Cache hits since the process started.", ("cache",), lambda: _cache_values("hits"), kind="counter")
+CallbackMetric("cache_misses_total", "Cache misses since the process started.", ("cache",), lambda: _cache_values("misses"), kind="counter")
+CallbackMetric("cache_hit_ratio", "Hits over lookups since the process started.", ("cache",), _cache_hit_ratio)
+
+
+# --- Requests ---
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and status of every request by route template,
+    and printing a breakdown of spans and queries for requests slower than SLOW_REQUEST_MS.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        trace = {"spans": [], "queries": []} if SLOW_REQUEST_MS else None
+        token = _trace.set(trace)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _trace.reset(token)
+            # The router stores the matched route in the scope; its template keeps the label set small.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(elapsed, method=scope["method"], route=route)
+            requests_total.inc(method=scope["method"], route=route, status=status)
+            if trace is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _log_slow_request(scope["method"], scope["path"], status, elapsed, trace)
+
+def _log_slow_request(method: str, path: str, status: int, elapsed: float, trace: dict):
+    queries = trace["queries"]
+    print(f"Slow request: {method} {path} -> {status} in {elapsed * 1000:.1f} ms "
+          f"({len(queries)} queries, {sum(q[0] for q in queries) * 1000:.1f} ms in the database)")
+    totals = {}
+    for name, duration in trace["spans"]:
+        count, total = totals.get(name, (0, 0.0))
+        totals[name] = (count + 1, total + duration)
+    for name, (count, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        print(f"  span {name}: {count}x, {total * 1000:.1f} ms")
+    for duration, current, statement in sorted(queries, key=lambda q: -q[0])[:SLOW_REQUEST_MAX_QUERIES]:
+        print(f"  query {duration * 1000:.1f} ms [{current}] {_WHITESPACE.sub(' ', statement)[:300]}")
@@ -0,0 +1,56 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from . import models, catalog, search, database
+
+# (table, column, referenced table) for the foreign keys that cascade deletes in the database.
+CASCADING_FOREIGN_KEYS = [
+    ("receipts", "owner_id", "users"),
+    ("items", "receipt_id", "receipts"),
+    ("search_terms", "receipt_id", "receipts"),
+    ("monthly_spending", "owner_id", "users"),
+    ("monthly_item_spending", "owner_id", "users"),
+]
+
+
+def upgrade(db: Session):
+    """
+    Brings the database schema up to date: creates missing tables, then applies the in-place
+    upgrades (item catalog columns, Postgres trigram indexes, missing model indexes, ON DELETE
+    CASCADE foreign keys). Safe to run repeatedly.
+    """
+    models.Base.metadata.create_all(bind=db.get_bind())
+    catalog.ensure_schema(db)
+    search.ensure_indexes(db)
+    ensure_indexes(db)
+    ensure_cascading_foreign_keys(db)
+
+def ensure_indexes(db: Session):
+    """Creates the model indexes that tables created by older versions lack, without blocking writes on Postgres."""
+    database.create_indexes(db, [index for table in models.Base.metadata.sorted_tables for index in table.indexes])
+
+def ensure_cascading_foreign_keys(db: Session):
+    """
+    Recreates the foreign keys in CASCADING_FOREIGN_KEYS with ON DELETE CASCADE on Postgres.
+    The new constraint is added NOT VALID and validated afterwards, so the tables stay
+    writable while existing rows are checked. SQLite cannot alter constraints; databases
+    created before this keep plain foreign keys there, and app.deletion does not rely on them.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    inspector = inspect(db.connection())
+    for table, column, referred_table in CASCADING_FOREIGN_KEYS:
+        for foreign_key in inspector.get_foreign_keys(table):
+            if foreign_key["constrained_columns"] != [column] or foreign_key["referred_table"] != referred_table:
+                continue
+            if (foreign_key.get("options") or {}).get("ondelete", "").upper() == "CASCADE":
+                continue
+            name = foreign_key["name"]
+            print(f"Adding ON DELETE CASCADE to {table}.{column}...")
+            db.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+            db.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) '
+                f'REFERENCES {referred_table} (id) ON DELETE CASCADE NOT VALID'
+            ))
+            db.commit()
+            db.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT "{name}"'))
+            db.commit()
@@ -1,19 +1,117 @@
+import os
+import math
 import pytesseract
-from PIL import Image
+from PIL import Image, ImageOps
+
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "true").lower() == "true"
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "true").lower() == "true"
+OCR_CROP = os.getenv("OCR_CROP", "true").lower() == "true"
+# Receipts are printed on ~80mm paper; Tesseract reads best at around 300 DPI.
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_RECEIPT_WIDTH_MM = float(os.getenv("OCR_RECEIPT_WIDTH_MM", "80"))
+
+def _target_width():
+    return int(OCR_RECEIPT_WIDTH_MM / 25.4 * OCR_TARGET_DPI)
+
+def _otsu_threshold(image):
+    """Returns the Otsu threshold of a grayscale image, computed from its histogram."""
+    histogram = image.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background, weight_background = 0.0, 0
+    best_threshold, best_variance = 127, 0.0
+    for i, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += i * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+def _receipt_box(image):
+    """Returns the bounding box of the bright paper area of a grayscale photo, or None if there is none."""
+    factor = max(1, min(image.size) // 200)
+    small = image.reduce(factor)
+    threshold = _otsu_threshold(small)
+    # Averaging 8x8 blocks and keeping the mostly-white ones drops text and speckles.
+    mask = small.point(lambda p: 255 if p > threshold else 0).reduce(8).point(lambda p: 255 if p > 160 else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return None
+    scale = factor * 8
+    left, top, right, bottom = (v * scale for v in bbox)
+    if (right - left) * (bottom - top) < 0.2 * image.size[0] * image.size[1]:
+        return None
+    return left, top, min(right, image.size[0]), min(bottom, image.size[1])
+
+def _crop_to_receipt(image):
+    """Crops a grayscale photo to the bright paper area, leaving it untouched if none is found."""
+    box = _receipt_box(image)
+    return image.crop(box) if box else image
+
+def _draft_size(image, target_width):
+    """
+    The size to request from the JPEG decoder so that the receipt, once cropped, is still at
+    least target_width wide. The crop is found on a second, heavily reduced decode of the file;
+    without the file the decoder is not asked to reduce at all.
+    """
+    if not OCR_CROP:
+        return target_width
+    if not getattr(image, "filename", None):
+        return None
+    with Image.open(image.filename) as probe:
+        probe.draft("L", (400, 400))
+        probe = ImageOps.exif_transpose(probe).convert("L")
+        box = _receipt_box(probe)
+        if not box:
+            return target_width
+        # Either side may end up horizontal after the EXIF rotation, so scale by the narrower ratio.
+        ratio = min((box[2] - box[0]) / probe.size[0], (box[3] - box[1]) / probe.size[1])
+    return math.ceil(target_width / ratio)
+
+def preprocess_image(image):
+    """
+    Normalizes a receipt photo for OCR: applies the EXIF rotation, converts to grayscale,
+    crops to the receipt, downscales to the target DPI and binarizes.
+    """
+    target_width = _target_width()
+    if image.format == "JPEG":
+        # Let the JPEG decoder skip detail we would throw away anyway.
+        draft_size = _draft_size(image, target_width)
+        if draft_size:
+            image.draft("L", (draft_size, draft_size))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    if OCR_CROP:
+        image = _crop_to_receipt(image)
+    if image.size[0] > target_width:
+        height = max(1, round(image.size[1] * target_width / image.size[0]))
+        image = image.resize((target_width, height), Image.Resampling.LANCZOS)
+    if OCR_BINARIZE:
+        threshold = _otsu_threshold(image)
+        image = image.point(lambda p: 255 if p > threshold else 0)
+    return image
 
 def extract_text_from_image(image_path):
     """
     Extracts text from an image using Tesseract OCR.
     It is configured to recognize both English and Japanese characters
     using the advanced LSTM OCR engine and a specific page segmentation mode.
+    Errors (an unreadable image, Tesseract failing) are raised rather than returned as no
+    text, so callers can tell a failed OCR from an image without text.
     """
-    try:
-        image = Image.open(image_path)
-       
-        custom_config = r'-l eng+jpn --oem 1 --psm 6'
-        
-        text = pytesseract.image_to_string(image, config=custom_config)
-        return text
-    except Exception as e:
-        print(f"An error occurred during OCR: {e}")
-        return ""
\ No newline at end of file
+    image = Image.open(image_path)
+    if OCR_PREPROCESS:
+        image = preprocess_image(image)
+
+    custom_config = r'-l eng+jpn --oem 1 --psm 6'
+
+    text = pytesseract.image_to_string(image, config=custom_config)
+    return text
@@ -0,0 +1,187 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+from . import models
+
+SPENDING_KEYS = ("owner_id", "month", "category")
+SPENDING_VALUES = ("total_amount", "tax_amount", "receipt_count")
+ITEM_KEYS = ("owner_id", "month", "canonical_item_id")
+ITEM_VALUES = ("subtotal", "quantity", "item_count")
+
+
+def month_start(value) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+def next_month(value: datetime.date) -> datetime.date:
+    return datetime.date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def split_date_range(start_date: datetime.date, end_date: datetime.date):
+    """
+    Splits the dashboard filter `start_date <= receipt_date < end_date + 1 day` (end_date is a
+    whole day, as in crud.filter_receipts) into whole months, served from the rollups, and the
+    partial edge ranges that must be read from raw receipts.
+    Returns (first_month, end_month, raw_ranges): months in [first_month, end_month) are whole,
+    and raw_ranges is a list of [lower, upper) bounds on receipt_date.
+    """
+    upper = end_date + datetime.timedelta(days=1)
+    first_month = start_date if start_date.day == 1 else next_month(start_date)
+    # An end_date on the last day of its month makes that month whole.
+    end_month = month_start(upper)
+    if first_month >= end_month:
+        return None, None, [(start_date, upper)]
+    raw_ranges = []
+    if start_date < first_month:
+        raw_ranges.append((start_date, first_month))
+    if end_month < upper:
+        raw_ranges.append((end_month, upper))
+    return first_month, end_month, raw_ranges
+
+
+def _receipt_deltas(receipts, sign: int):
+    """
+    Sums (owner_id, receipt_date, category, total, tax, items) tuples, where items are
+    (canonical_item_id, subtotal, quantity) tuples, into rollup row deltas multiplied by sign.
+    """
+    spending = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+    items = defaultdict(lambda: [Decimal(0), 0, 0])
+    for owner_id, receipt_date, category, total, tax, receipt_items in receipts:
+        if receipt_date is None or category is None:
+            continue
+        month = month_start(receipt_date)
+        row = spending[(owner_id, month, category)]
+        row[0] += sign * Decimal(str(total or 0))
+        row[1] += sign * Decimal(str(tax or 0))
+        row[2] += sign
+        for canonical_item_id, subtotal, quantity in receipt_items:
+            if canonical_item_id is None:
+                continue
+            row = items[(owner_id, month, canonical_item_id)]
+            row[0] += sign * Decimal(str(subtotal or 0))
+            row[1] += sign * (quantity or 0)
+            row[2] += sign
+    return (
+        [dict(zip(SPENDING_KEYS + SPENDING_VALUES, key + tuple(values))) for key, values in spending.items()],
+        [dict(zip(ITEM_KEYS + ITEM_VALUES, key + tuple(values))) for key, values in items.items()],
+    )
+
+def _upsert_add(db: Session, model, keys, values, rows):
+    """Adds the value columns of rows onto existing rollup rows, inserting the missing ones."""
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + statement.excluded[column] for column in values},
+        )
+        db.execute(statement, rows)
+        return
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(*(table.c[key] == row[key] for key in keys))
+            .values({column: table.c[column] + row[column] for column in values})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table).values(row))
+
+def _apply(db: Session, receipts, sign: int):
+    spending_rows, item_rows = _receipt_deltas(receipts, sign)
+    _upsert_add(db, models.MonthlySpending, SPENDING_KEYS, SPENDING_VALUES, spending_rows)
+    _upsert_add(db, models.MonthlyItemSpending, ITEM_KEYS, ITEM_VALUES, item_rows)
+    if sign < 0:
+        owner_ids = {row["owner_id"] for row in spending_rows}
+        db.execute(delete(models.MonthlySpending).where(models.MonthlySpending.owner_id.in_(owner_ids), models.MonthlySpending.receipt_count <= 0))
+        db.execute(delete(models.MonthlyItemSpending).where(models.MonthlyItemSpending.owner_id.in_(owner_ids), models.MonthlyItemSpending.item_count <= 0))
+
+
+def add_receipts(db: Session, receipts, user_id: int, canonical_ids: dict):
+    """
+    Adds newly created schemas.ReceiptCreate objects to the user's rollups, given the
+    item name -> canonical item id mapping from app.catalog. Does not commit.
+    """
+    _apply(db, (
+        (user_id, r.receipt_date, r.category, r.total_amount, r.tax_amount,
+         [(canonical_ids.get(i.item_name), i.subtotal, i.quantity) for i in r.items])
+        for r in receipts
+    ), 1)
+
+def remove_receipts(db: Session, receipts):
+    """Subtracts models.Receipt rows that are about to be deleted from the rollups. Does not commit."""
+    _apply(db, (
+        (r.owner_id, r.receipt_date, r.category, r.total_amount, r.tax_amount,
+         [(i.canonical_item_id, i.subtotal, i.quantity) for i in r.items])
+        for r in receipts
+    ), -1)
+
+def remove_receipt_ids(db: Session, receipt_ids):
+    """
+    Subtracts the receipts with the given ids, which are about to be deleted, from the rollups,
+    reading only the columns the rollups need. Receipts without an owner are skipped. Does not commit.
+    """
+    items = defaultdict(list)
+    for receipt_id, canonical_item_id, subtotal, quantity in db.execute(
+        select(models.Item.receipt_id, models.Item.canonical_item_id, models.Item.subtotal, models.Item.quantity)
+        .where(models.Item.receipt_id.in_(receipt_ids))
+    ):
+        items[receipt_id].append((canonical_item_id, subtotal, quantity))
+    receipts = db.execute(
+        select(models.Receipt.id, models.Receipt.owner_id, models.Receipt.receipt_date, models.Receipt.category,
+               models.Receipt.total_amount, models.Receipt.tax_amount)
+        .where(models.Receipt.id.in_(receipt_ids), models.Receipt.owner_id.isnot(None))
+    ).all()
+    _apply(db, ((r.owner_id, r.receipt_date, r.category, r.total_amount, r.tax_amount, items[r.id]) for r in receipts), -1)
+
+def remove_user(db: Session, user_id: int):
+    """Drops all rollup rows of a user. Does not commit."""
+    db.execute(delete(models.MonthlySpending).where(models.MonthlySpending.owner_id == user_id))
+    db.execute(delete(models.MonthlyItemSpending).where(models.MonthlyItemSpending.owner_id == user_id))
+
+
+def rebuild(db: Session, user_id: int = None, batch_size: int = 5000) -> dict:
+    """
+    Recomputes the rollups from the raw receipts and items, for one user or everyone.
+    Rows are streamed, so memory grows with the number of rollup rows, not receipts.
+    """
+    receipt_query = db.query(
+        models.Receipt.owner_id, models.Receipt.receipt_date, models.Receipt.category,
+        models.Receipt.total_amount, models.Receipt.tax_amount,
+    ).filter(models.Receipt.owner_id.isnot(None))
+    item_query = db.query(
+        models.Receipt.owner_id, models.Receipt.receipt_date,
+        models.Item.canonical_item_id, models.Item.subtotal, models.Item.quantity,
+    ).join(models.Receipt, models.Item.receipt_id == models.Receipt.id).filter(models.Receipt.owner_id.isnot(None))
+    if user_id is not None:
+        receipt_query = receipt_query.filter(models.Receipt.owner_id == user_id)
+        item_query = item_query.filter(models.Receipt.owner_id == user_id)
+
+    spending_rows, _ = _receipt_deltas(
+        ((owner_id, receipt_date, category, total, tax, []) for owner_id, receipt_date, category, total, tax in receipt_query.yield_per(batch_size)), 1
+    )
+    _, item_rows = _receipt_deltas(
+        ((owner_id, receipt_date, "", 0, 0, [(canonical_item_id, subtotal, quantity)]) for owner_id, receipt_date, canonical_item_id, subtotal, quantity in item_query.yield_per(batch_size)), 1
+    )
+
+    try:
+        if user_id is None:
+            db.execute(delete(models.MonthlySpending))
+            db.execute(delete(models.MonthlyItemSpending))
+        else:
+            remove_user(db, user_id)
+        for start in range(0, len(spending_rows), batch_size):
+            db.execute(insert(models.MonthlySpending), spending_rows[start:start + batch_size])
+        for start in range(0, len(item_rows), batch_size):
+            db.execute(insert(models.MonthlyItemSpending), item_rows[start:start + batch_size])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"spending_rows": len(spending_rows), "item_rows": len(item_rows)}
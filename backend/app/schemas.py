@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class User(BaseModel):
     id: int
@@ -36,15 +36,22 @@ class ReceiptBase(BaseModel):
 class ReceiptCreate(ReceiptBase):
     items: List[ItemCreate]
 
-class Receipt(ReceiptBase):
-    id: int
-    owner_id: int
-    upload_date: datetime.datetime
-    items: List[Item] = []
-    owner: User 
+class ReceiptSummary(BaseModel):
+    """A receipt as the listings return it; ?fields= and ?include= decide which fields are present."""
+    id: Optional[int] = None
+    seller_name: Optional[str] = None
+    category: Optional[str] = None
+    receipt_date: Optional[datetime.datetime] = None
+    upload_date: Optional[datetime.datetime] = None
+    total_amount: Optional[float] = None
+    tax_amount: Optional[float] = None
+    owner_id: Optional[int] = None
+    owner_email: Optional[str] = None
+    items: Optional[List[Item]] = None
 
-    class Config:
-        from_attributes = True
+class ReceiptSummaryPage(BaseModel):
+    receipts: List[ReceiptSummary]
+    next_cursor: Optional[str] = None
 
 class UserBase(BaseModel):
     email: str
@@ -65,4 +72,41 @@ class KPIData(BaseModel):
 
 class TimeSeriesData(BaseModel):
     label: str
-    value: float
\ No newline at end of file
+    value: float
+
+class DashboardSummary(BaseModel):
+    kpis: KPIData
+    category: List[ChartData]
+    time_series: List[TimeSeriesData]
+    top_items: List[ChartData]
+
+class SpendingSummary(BaseModel):
+    kpis: KPIData
+    category: List[ChartData]
+    time_series: List[TimeSeriesData]
+
+class IngestJob(BaseModel):
+    id: str
+    status: str
+    filename: Optional[str] = None
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    stages: Dict[str, float] = {}
+    cache_hits: List[str] = []
+    parser: Optional[str] = None
+    receipt_id: Optional[int] = None
+    duplicate_of: Optional[int] = None
+    error: Optional[str] = None
+
+class DeletionJob(BaseModel):
+    id: str
+    user_id: int
+    status: str
+    receipts_total: Optional[int] = None
+    receipts_deleted: int = 0
+    items_deleted: int = 0
+    created_at: datetime.datetime
+    started_at: Optional[datetime.datetime] = None
+    finished_at: Optional[datetime.datetime] = None
+    error: Optional[str] = None
\ No newline at end of file
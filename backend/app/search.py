@@ -0,0 +1,175 @@
+import re
+import math
+import datetime
+import unicodedata
+from sqlalchemy import case, delete, func, insert, literal, or_, select, text, union_all
+from sqlalchemy.orm import Session, selectinload
+from . import crud, database, models, metrics
+
+SEARCH_PAGE_SIZE_MAX = 100
+# Share of the query's terms a receipt must contain on SQLite, which allows for OCR typos.
+MIN_TERM_MATCH = 0.7
+# Latin words are indexed with their prefixes so "coc" finds "Coca-Cola"; runs of Japanese
+# (or any other unspaced script) are indexed as character unigrams and bigrams.
+_RUNS = re.compile(r"[0-9a-zÀ-ɏ]+|[^\W0-9a-zÀ-ɏ_]+")
+_LATIN = re.compile(r"[0-9a-zÀ-ɏ]")
+MAX_PREFIX_LENGTH = 20
+# (name, table, column) of the Postgres trigram indexes behind ILIKE searches.
+TRIGRAM_INDEXES = [
+    ("ix_receipts_seller_name_trgm", "receipts", "seller_name"),
+    ("ix_items_item_name_trgm", "items", "item_name"),
+]
+
+
+def uses_inverted_index(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+def _runs(value: str):
+    return _RUNS.findall(unicodedata.normalize("NFKC", value or "").casefold())
+
+def index_terms(value: str) -> set:
+    terms = set()
+    for run in _runs(value):
+        if _LATIN.match(run):
+            terms.update(run[:length] for length in range(1, min(len(run), MAX_PREFIX_LENGTH) + 1))
+        else:
+            terms.update(run)
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+def query_terms(value: str) -> list:
+    terms = []
+    for run in _runs(value):
+        if _LATIN.match(run) or len(run) == 1:
+            terms.append(run[:MAX_PREFIX_LENGTH])
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def index_receipts(db: Session, receipts, user_id: int):
+    """
+    Adds (db_receipt, schemas.ReceiptCreate) pairs to the SQLite inverted index; Postgres
+    searches the columns through trigram indexes instead. Does not commit.
+    """
+    if not uses_inverted_index(db):
+        return
+    rows = []
+    for db_receipt, receipt in receipts:
+        weights = {term: 1 for item in receipt.items for term in index_terms(item.item_name)}
+        weights.update({term: 2 for term in index_terms(receipt.seller_name)})
+        rows.extend({"owner_id": user_id, "term": term, "receipt_id": db_receipt.id, "weight": weight} for term, weight in weights.items())
+    if rows:
+        db.execute(insert(models.SearchTerm), rows)
+
+def remove_receipt(db: Session, receipt_id: int):
+    if uses_inverted_index(db):
+        db.execute(delete(models.SearchTerm).where(models.SearchTerm.receipt_id == receipt_id))
+
+def remove_user(db: Session, user_id: int):
+    if uses_inverted_index(db):
+        db.execute(delete(models.SearchTerm).where(models.SearchTerm.owner_id == user_id))
+
+
+def _inverted_index_matches(user_id: int, q: str):
+    terms = query_terms(q)
+    if not terms:
+        return None
+    hits = func.count(models.SearchTerm.term)
+    return (
+        select(models.SearchTerm.receipt_id, (hits * 10 + func.sum(models.SearchTerm.weight)).label("score"))
+        .where(models.SearchTerm.owner_id == user_id, models.SearchTerm.term.in_(terms))
+        .group_by(models.SearchTerm.receipt_id)
+        .having(hits >= max(1, math.ceil(len(terms) * MIN_TERM_MATCH)))
+        .subquery("matches")
+    )
+
+def _trigram_matches(user_id: int, q: str):
+    """Substring (ILIKE) or fuzzy (pg_trgm word similarity) hits, both served by GIN trigram indexes."""
+    q = " ".join(unicodedata.normalize("NFKC", q).split())
+    if not q:
+        return None
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    seller_score = func.word_similarity(q, models.Receipt.seller_name) + case((models.Receipt.seller_name.ilike(pattern), 1), else_=0)
+    item_score = func.word_similarity(q, models.Item.item_name) + case((models.Item.item_name.ilike(pattern), 1), else_=0)
+    hits = union_all(
+        select(models.Receipt.id.label("receipt_id"), (seller_score * 2).label("score"))
+        .where(models.Receipt.owner_id == user_id)
+        .where(or_(models.Receipt.seller_name.ilike(pattern), literal(q).op("<%")(models.Receipt.seller_name))),
+        select(models.Item.receipt_id, item_score)
+        .join(models.Receipt, models.Item.receipt_id == models.Receipt.id)
+        .where(models.Receipt.owner_id == user_id)
+        .where(or_(models.Item.item_name.ilike(pattern), literal(q).op("<%")(models.Item.item_name))),
+    ).subquery("hits")
+    return (
+        select(hits.c.receipt_id, func.max(hits.c.score).label("score"))
+        .group_by(hits.c.receipt_id)
+        .subquery("matches")
+    )
+
+@metrics.timed
+def search_receipts(db: Session, user_id: int, q: str, cursor: str = None, limit: int = 20,
+                    start_date: datetime.date = None, end_date: datetime.date = None, category: str = None,
+                    include_items: bool = True):
+    """
+    Returns (receipts, next_cursor) for the user's receipts whose seller or item names match q,
+    best match first. The cursor is the offset of the next page; raises ValueError if malformed.
+    """
+    limit = max(1, min(limit, SEARCH_PAGE_SIZE_MAX))
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    matches = _inverted_index_matches(user_id, q) if uses_inverted_index(db) else _trigram_matches(user_id, q)
+    if matches is None:
+        return [], None
+    query = select(models.Receipt).join(matches, matches.c.receipt_id == models.Receipt.id)
+    if include_items:
+        query = query.options(selectinload(models.Receipt.items))
+    query = crud.filter_receipts(query, start_date=start_date, end_date=end_date, category=category)
+    receipts = db.scalars(
+        query.order_by(matches.c.score.desc(), models.Receipt.upload_date.desc(), models.Receipt.id.desc())
+        .offset(offset)
+        .limit(limit + 1)
+    ).all()
+    next_cursor = str(offset + limit) if len(receipts) > limit else None
+    return receipts[:limit], next_cursor
+
+
+def ensure_indexes(db: Session):
+    """
+    Creates the Postgres trigram indexes (and the pg_trgm extension) if they are missing.
+    The indexes are built concurrently, so receipts can still be written meanwhile.
+    """
+    if uses_inverted_index(db):
+        return
+    db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    db.commit()
+    with database.maintenance_connection(db.get_bind()) as connection:
+        for name, table, column in TRIGRAM_INDEXES:
+            database.create_index_concurrently(connection, name, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)")
+
+def rebuild_index(db: Session, batch_size: int = 1000) -> int:
+    """Recomputes the SQLite inverted index from the receipts table. Returns the receipts indexed."""
+    if not uses_inverted_index(db):
+        return 0
+    db.execute(delete(models.SearchTerm))
+    indexed = 0
+    last_id = 0
+    while True:
+        receipts = db.scalars(
+            select(models.Receipt).options(selectinload(models.Receipt.items))
+            .where(models.Receipt.owner_id.isnot(None), models.Receipt.id > last_id)
+            .order_by(models.Receipt.id)
+            .limit(batch_size)
+        ).all()
+        if not receipts:
+            break
+        for owner_id in {receipt.owner_id for receipt in receipts}:
+            index_receipts(db, [(receipt, receipt) for receipt in receipts if receipt.owner_id == owner_id], owner_id)
+        indexed += len(receipts)
+        last_id = receipts[-1].id
+        db.commit()
+        db.expunge_all()
+    db.commit()
+    return indexed
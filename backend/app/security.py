@@ -1,8 +1,12 @@
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+from . import metrics
+from .cache import LRUCache
 
 load_dotenv() 
 
@@ -14,6 +18,10 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt takes a few hundred milliseconds by design; keep it off the event loop.
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.to_thread(verify_password, plain_password, hashed_password)
+
 SECRET_KEY = os.getenv("SECRET_KEY") 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
@@ -23,4 +31,31 @@ def create_access_token(data: dict):
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+def decode_access_token(token: str) -> dict:
+    """Returns the verified claims of a token, raising JWTError if it is invalid or expired."""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+# Users resolved from recent tokens, keyed by the token subject (the email), so authenticated
+# requests skip the database. Entries expire after a short TTL, which also bounds how long
+# other worker processes keep serving a deleted user or a stale admin flag.
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+principal_cache = LRUCache(max_size=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")))
+metrics.register_cache("principal", principal_cache.stats)
+
+def get_cached_principal(subject: str):
+    entry = principal_cache.get(subject)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+def cache_principal(subject: str, user) -> dict:
+    principal = {"id": user.id, "email": user.email, "is_admin": bool(user.is_admin)}
+    principal_cache.set(subject, (time.monotonic() + PRINCIPAL_CACHE_TTL, principal))
+    return principal
+
+def invalidate_principal(subject: str):
+    """Forgets a cached user in this process, e.g. after it was deleted through this server."""
+    principal_cache.delete(subject)
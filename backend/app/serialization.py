@@ -0,0 +1,138 @@
+import os
+import gzip
+import json
+import datetime
+from decimal import Decimal
+from fastapi import Request, Response
+
+# orjson is listed in requirements.txt; brotli is optional and only used when installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies at least this large are compressed for clients that accept it; 0 turns compression off.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+RECEIPT_FIELDS = ("id", "seller_name", "category", "receipt_date", "upload_date", "total_amount", "tax_amount", "owner_id", "owner_email", "items")
+# What listings return without ?fields=: the owner is identified by id only, and items are left out.
+DEFAULT_RECEIPT_FIELDS = ("id", "seller_name", "category", "receipt_date", "upload_date", "total_amount", "tax_amount", "owner_id")
+INCLUDABLE_FIELDS = ("items", "owner_email")
+AMOUNT_FIELDS = ("total_amount", "tax_amount")
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "_asdict"):
+        return value._asdict()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    """Encodes content as JSON, with orjson when available. Decimals become floats and result rows dicts."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def parse_receipt_fields(fields: str = None, include: str = None) -> tuple:
+    """
+    Returns the receipt fields a listing should return: those named in fields (comma-separated,
+    default DEFAULT_RECEIPT_FIELDS) plus those named in include (items, owner_email).
+    Raises ValueError for unknown names.
+    """
+    selected = [name.strip() for name in fields.split(",") if name.strip()] if fields else list(DEFAULT_RECEIPT_FIELDS)
+    included = [name.strip() for name in include.split(",") if name.strip()] if include else []
+    unknown = [name for name in selected if name not in RECEIPT_FIELDS] + [name for name in included if name not in INCLUDABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown receipt fields: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(selected + included))
+
+def _item_dict(item) -> dict:
+    return {"id": item.id, "receipt_id": item.receipt_id, "item_name": item.item_name, "quantity": item.quantity,
+            "rate": float(item.rate) if item.rate is not None else None,
+            "subtotal": float(item.subtotal) if item.subtotal is not None else None}
+
+def receipt_dicts(receipts, fields: tuple) -> list:
+    """Flattens Receipt rows into dicts holding only the selected fields."""
+    rows = []
+    for receipt in receipts:
+        row = {}
+        for field in fields:
+            if field == "items":
+                row["items"] = [_item_dict(item) for item in receipt.items]
+            elif field in AMOUNT_FIELDS:
+                value = getattr(receipt, field)
+                row[field] = float(value) if value is not None else None
+            else:
+                row[field] = getattr(receipt, field)
+        rows.append(row)
+    return rows
+
+
+def _encoding_qvalues(request: Request) -> dict:
+    """Maps each content coding in Accept-Encoding to its q-value (1 when not given)."""
+    qvalues = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+    return qvalues
+
+def choose_encoding(request: Request, size: int):
+    """Returns the content coding ("br" or "gzip") for a body of size bytes, or None to send it as is."""
+    if not COMPRESS_MIN_BYTES or size < COMPRESS_MIN_BYTES:
+        return None
+    qvalues = _encoding_qvalues(request)
+    # A coding refused with q=0 is never used, even if "*" would allow it.
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if qvalues.get(coding, qvalues.get("*", 0)) > 0:
+            return coding
+    return None
+
+def encoded_etag(etag: str, encoding) -> str:
+    """The ETag of one encoding of a representation; every content coding gets its own tag."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+def vary_headers() -> dict:
+    return {"Vary": "Accept-Encoding"} if COMPRESS_MIN_BYTES else {}
+
+def compressed_response(request: Request, body: bytes, media_type: str = "application/json", status_code: int = 200, headers: dict = None) -> Response:
+    """
+    Wraps body in a Response, brotli- or gzip-compressed when it is large and the client accepts
+    it. An ETag in headers is suffixed with the coding used.
+    """
+    headers = dict(headers or {}, **vary_headers())
+    encoding = choose_encoding(request, len(body))
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        if "ETag" in headers:
+            headers["ETag"] = encoded_etag(headers["ETag"], encoding)
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+def json_response(request: Request, content, status_code: int = 200, headers: dict = None) -> Response:
+    return compressed_response(request, dumps(content), status_code=status_code, headers=headers)
@@ -0,0 +1,22 @@
+import sys
+from app.database import SessionLocal
+from app import catalog, rollups
+
+def backfill_catalog(batch_size: int = 5000):
+    """Links existing items to the item catalog and rebuilds the rollups that are keyed by it."""
+    db = SessionLocal()
+    try:
+        catalog.ensure_schema(db)
+        updated = catalog.backfill(db, batch_size=batch_size)
+        print(f"Linked {updated} items to the catalog.")
+        result = rollups.rebuild(db)
+        print(f"Success! Rebuilt {result['spending_rows']} category rows and {result['item_rows']} item rows.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    backfill_catalog(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,89 @@
+"""
+Compares the SQL dashboard aggregates with the in-memory analytics index for random date ranges.
+
+Usage: python benchmarks/bench_analytics.py [--ranges N] [--users N] [--receipts N] [--months N]
+
+Seeds DATABASE_URL (a temp SQLite file by default) with datagen, then computes the KPIs,
+category split and monthly series of one user for the same random ranges through crud with
+ANALYTICS_ENABLED off and on, plus the cross-user admin summary. Prints one JSON object per
+mode with the median time per range and the time to build the index.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "receipts_bench.db"))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SECRET_KEY", "offline-benchmark")
+from benchmarks import datagen
+from app import analytics, crud, migrations
+from app.database import SessionLocal
+
+
+def random_ranges(count: int, months: int, seed: int = 7):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    ranges = []
+    for _ in range(count):
+        start = today - datetime.timedelta(days=rng.randrange(months * 30))
+        ranges.append((start, start + datetime.timedelta(days=rng.randint(1, months * 30))))
+    return ranges
+
+def time_ranges(compute, ranges):
+    timings = []
+    for start_date, end_date in ranges:
+        started = time.perf_counter()
+        compute(start_date, end_date)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ranges", type=int, default=200)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--receipts", type=int, default=2000, help="median receipts per user")
+    parser.add_argument("--months", type=int, default=36)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+        datagen.generate(db, users=args.users, receipts=args.receipts, months=args.months)
+        user_id = crud.get_user_by_email(db, "bench-user-0@example.com").id
+        ranges = random_ranges(args.ranges, args.months)
+
+        def dashboard(start_date, end_date):
+            crud.get_kpi_data(db, user_id, start_date, end_date)
+            crud.get_spending_by_category(db, user_id, start_date, end_date)
+            crud.get_spending_over_time(db, user_id, start_date, end_date)
+
+        results = []
+        analytics.ANALYTICS_ENABLED = False
+        results.append({"mode": "sql", "scope": "user", "ms_per_range": time_ranges(dashboard, ranges) * 1000})
+        analytics.ANALYTICS_ENABLED = True
+        started = time.perf_counter()
+        index = analytics.get_index(db, user_id)
+        build_ms = (time.perf_counter() - started) * 1000
+        results.append({"mode": "analytics", "scope": "user", "ms_per_range": time_ranges(dashboard, ranges) * 1000,
+                        "build_ms": build_ms, "index_bytes": index.nbytes})
+        started = time.perf_counter()
+        index = analytics.get_index(db, analytics.ALL_USERS)
+        build_ms = (time.perf_counter() - started) * 1000
+        results.append({"mode": "analytics", "scope": "all users",
+                        "ms_per_range": time_ranges(lambda s, e: analytics.get_summary(db, analytics.ALL_USERS, s, e), ranges) * 1000,
+                        "build_ms": build_ms, "index_bytes": index.nbytes})
+    finally:
+        db.close()
+    for result in results:
+        print(json.dumps({key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures the per-request cost of resolving the current user, and how long bcrypt logins
+stall the event loop, before and after the principal cache and off-loop password checks.
+
+Usage: python benchmarks/bench_auth.py [--requests N] [--db-latency-ms MS] [--logins N]
+
+The database is in-memory SQLite; --db-latency-ms adds a sleep per query to stand in for
+the network round-trip to the hosted Postgres. Prints one JSON object per scenario.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("SECRET_KEY", "offline-benchmark")
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import models, crud, security
+
+
+def make_session(db_latency_ms):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    if db_latency_ms:
+        event.listen(engine, "before_cursor_execute", lambda *args: time.sleep(db_latency_ms / 1000))
+    models.Base.metadata.create_all(bind=engine, tables=[models.User.__table__])
+    return sessionmaker(bind=engine)()
+
+
+def resolve_uncached(db, token):
+    """What get_current_user did before: decode, then one query per request."""
+    payload = security.decode_access_token(token)
+    return crud.get_user_by_email(db, email=payload["sub"])
+
+def resolve_cached(db, token):
+    """What get_current_user does now: decode, then a cache hit after the first request."""
+    payload = security.decode_access_token(token)
+    principal = security.get_cached_principal(payload["sub"])
+    if principal is None:
+        principal = security.cache_principal(payload["sub"], crud.get_user_by_id(db, payload["uid"]))
+    return models.User(**principal)
+
+def time_requests(name, resolve, db, token, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        resolve(db, token)
+    elapsed = time.perf_counter() - started
+    return {"scenario": name, "requests": requests, "us_per_request": round(elapsed / requests * 1e6, 1)}
+
+
+async def max_loop_stall(verify, hashed, logins):
+    """Runs concurrent logins while a ticker records the longest gap between its wake-ups."""
+    stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last)
+            last = now
+
+    async def login():
+        result = verify("password", hashed)
+        if asyncio.iscoroutine(result):
+            await result
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    done = True
+    await ticker_task
+    return round(stall * 1000, 1), round(elapsed * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--logins", type=int, default=4)
+    args = parser.parse_args()
+
+    db = make_session(args.db_latency_ms)
+    user = models.User(email="bench@example.com", hashed_password=security.get_password_hash("password"))
+    db.add(user)
+    db.commit()
+    token = security.create_access_token(data={"sub": user.email, "uid": user.id, "admin": False})
+
+    print(json.dumps(time_requests("uncached", resolve_uncached, db, token, args.requests)))
+    print(json.dumps(time_requests("principal_cache", resolve_cached, db, token, args.requests)))
+
+    for name, verify in (("login_on_loop", security.verify_password), ("login_in_thread", security.verify_password_async)):
+        stall_ms, wall_ms = asyncio.run(max_loop_stall(verify, user.hashed_password, args.logins))
+        print(json.dumps({"scenario": name, "logins": args.logins, "max_loop_stall_ms": stall_ms, "wall_ms": wall_ms}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures how long a fresh worker takes to import the app and answer its first request.
+
+Usage: python benchmarks/bench_cold_start.py [--runs N] [--mode api|ingest] [--database-url URL]
+
+Each run is a new interpreter, as a new uvicorn worker would be. The default database URL
+points at a directory that does not exist, so a run only succeeds if startup never touches
+the database. "api" is a plain worker; "ingest" sets INGEST_PRELOAD=true, loading the OCR and
+LLM backends in the lifespan. Prints one JSON object with the medians and the heavy modules
+each mode ends up importing.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY_MODULES = ("google.generativeai", "pytesseract", "PIL", "pandas", "numpy", "pyarrow")
+
+# Runs in the child: import main, then serve GET / through the lifespan in-process.
+CHILD = """
+import sys, time, json, asyncio
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+import httpx
+
+async def first_request():
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            (await client.get("/")).raise_for_status()
+
+asyncio.run(first_request())
+served = time.perf_counter()
+print(json.dumps({"import_s": imported - started, "first_response_s": served - started,
+                  "heavy_modules": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def run_once(mode, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, SECRET_KEY="offline-benchmark")
+    env.pop("GOOGLE_API_KEY", None)
+    if mode == "ingest":
+        env.update(INGEST_PRELOAD="true", GOOGLE_API_KEY="offline-benchmark", OCR_WORKERS="1")
+    result = subprocess.run([sys.executable, "-c", CHILD % (HEAVY_MODULES,)], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"worker failed to start:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mode", choices=("api", "ingest"), default="api")
+    parser.add_argument("--database-url", default="sqlite:////nonexistent/cold-start.db")
+    args = parser.parse_args()
+    runs = [run_once(args.mode, args.database_url) for _ in range(args.runs)]
+    print(json.dumps({
+        "mode": args.mode,
+        "runs": args.runs,
+        "import_s_median": round(statistics.median(r["import_s"] for r in runs), 3),
+        "import_s_min": round(min(r["import_s"] for r in runs), 3),
+        "first_response_s_median": round(statistics.median(r["first_response_s"] for r in runs), 3),
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares unbatched and batched Gemini parsing against the offline stub client.
+
+Usage: python benchmarks/bench_llm_batching.py [--receipts N] [--latency S] [--batch-sizes 1,4,8,16]
+
+Prints one JSON object per batch size with wall time, LLM calls and throughput.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+from app import llm_utils
+from benchmarks.stubs import StubLLMClient
+
+
+async def run(receipts, batch_size, latency, failure_rate):
+    client = StubLLMClient(latency=latency, failure_rate=failure_rate)
+    llm_utils.set_llm_client(client)
+    batcher = llm_utils.ReceiptBatcher(batch_size=batch_size)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(batcher.parse(f"receipt {i}") for i in range(receipts)))
+    elapsed = time.perf_counter() - started
+    return {
+        "batch_size": batch_size,
+        "receipts": receipts,
+        "parsed": sum(1 for r in results if r),
+        "llm_calls": client.calls,
+        "wall_s": round(elapsed, 3),
+        "receipts_per_s": round(receipts / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--receipts", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    args = parser.parse_args()
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        print(json.dumps(asyncio.run(run(args.receipts, batch_size, args.latency, args.failure_rate))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures what the request middleware, crud spans and query timers add to each request.
+
+Usage: python benchmarks/bench_metrics.py [--requests N] [--rounds N] [--users N] [--receipts N]
+
+Runs the app in-process against DATABASE_URL (a temp SQLite file by default, seeded with
+datagen) and times a cheap route and a database-bound one with instrumentation switched
+off, on, and on with the slow-request log collecting every request. Prints one JSON
+object per route and mode with the median time per request over the rounds.
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import contextlib
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "receipts_bench.db"))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SECRET_KEY", "offline-benchmark")
+import httpx
+from benchmarks import datagen
+from app import metrics, migrations
+from app.database import SessionLocal
+from main import app, lifespan
+
+# The page size varies so the listing is not served from any cache and always queries the database.
+ROUTES = {"root": lambda i: ("/", {}), "receipts.page": lambda i: ("/api/receipts/all", {"limit": 20 + i % 50})}
+MODES = {"off": (False, 0), "on": (True, 0), "on+slow-log": (True, 1e-9)}
+
+
+async def time_route(client, headers, route, requests):
+    started = time.perf_counter()
+    for i in range(requests):
+        path, params = ROUTES[route](i)
+        response = await client.get(path, params=params, headers=headers)
+        response.raise_for_status()
+    return (time.perf_counter() - started) / requests
+
+
+async def run(args):
+    async with lifespan(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.post("/token", data={"username": "bench-user-0@example.com", "password": datagen.PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        results = []
+        for route in ROUTES:
+            await time_route(client, headers, route, 20)
+            # The modes take turns for several rounds so drift (page cache, CPU clock) hits them equally.
+            timings = {mode: [] for mode in MODES}
+            for _ in range(args.rounds):
+                for mode, (enabled, slow_ms) in MODES.items():
+                    metrics.METRICS_ENABLED, metrics.SLOW_REQUEST_MS = enabled, slow_ms
+                    timings[mode].append(await time_route(client, headers, route, args.requests))
+            baseline = statistics.median(timings["off"])
+            for mode, values in timings.items():
+                per_request = statistics.median(values)
+                results.append({
+                    "route": route,
+                    "mode": mode,
+                    "requests": args.requests * args.rounds,
+                    "us_per_request": round(per_request * 1e6, 1),
+                    "overhead_us": round((per_request - baseline) * 1e6, 1),
+                })
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200, help="requests per mode and round")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--receipts", type=int, default=200)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+        datagen.generate(db, users=args.users, receipts=args.receipts)
+    finally:
+        db.close()
+    # The slow-request log prints every request in that mode; keep the JSON lines readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(run(args))
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures the payload size and serving time of the receipt listings and admin endpoints.
+
+Usage: python benchmarks/bench_serialization.py [--requests N] [--users N] [--receipts N]
+
+Runs the app in-process against DATABASE_URL (a temp SQLite file by default, seeded with
+datagen) and requests each case with and without compression. Prints one JSON object per
+case and encoding with the decoded body size, the bytes on the wire and the median time per
+request. Parameters an older tree does not know are ignored there, so the same script gives
+before/after numbers.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "receipts_bench.db"))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SECRET_KEY", "offline-benchmark")
+import httpx
+from benchmarks import datagen
+from app import migrations
+from app.database import SessionLocal
+from main import app, lifespan
+
+# (name, path, params, admin)
+CASES = [
+    ("receipts.page", "/api/receipts/all", {"limit": 500}, False),
+    ("receipts.page+items", "/api/receipts/all", {"limit": 500, "include": "items"}, False),
+    ("receipts.page fields=id,total_amount", "/api/receipts/all", {"limit": 500, "fields": "id,total_amount"}, False),
+    ("admin.receipts", "/api/admin/receipts", {"limit": 500}, True),
+    ("admin.users", "/api/admin/users", {}, True),
+]
+ENCODINGS = ("identity", "gzip", "br")
+
+
+async def login(client, email):
+    response = await client.post("/token", data={"username": email, "password": datagen.PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def measure(client, headers, path, params, encoding, requests):
+    headers = dict(headers, **{"Accept-Encoding": encoding})
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        response.raise_for_status()
+        await response.aread()
+        timings.append(time.perf_counter() - started)
+    return {
+        "body_bytes": len(response.content),
+        "wire_bytes": response.num_bytes_downloaded,
+        "content_encoding": response.headers.get("content-encoding", "identity"),
+        "ms_per_request": round(statistics.median(timings) * 1000, 3),
+    }
+
+async def run(args):
+    results = []
+    async with lifespan(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        user_headers = await login(client, "bench-user-0@example.com")
+        admin_headers = await login(client, datagen.ADMIN_EMAIL)
+        for name, path, params, admin in CASES:
+            headers = admin_headers if admin else user_headers
+            await measure(client, headers, path, params, "identity", 3)
+            for encoding in ENCODINGS:
+                results.append(dict({"case": name, "accept_encoding": encoding}, **await measure(client, headers, path, params, encoding, args.requests)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--receipts", type=int, default=600)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+        datagen.generate(db, users=args.users, receipts=args.receipts)
+    finally:
+        db.close()
+    for result in asyncio.run(run(args)):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
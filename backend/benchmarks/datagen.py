@@ -0,0 +1,157 @@
+"""
+Fills a database with synthetic users and receipts for the benchmarks.
+
+Usage: python benchmarks/datagen.py [--users N] [--receipts N] [--months N] [--seed N]
+
+Uses DATABASE_URL, defaulting to a SQLite file in the temp directory (never the hosted
+database). Receipts go through crud.import_receipts, so the rollups, item catalog and
+search index match what real uploads produce. Users that already exist are skipped, so
+running it twice with the same arguments leaves the data unchanged.
+Prints one JSON object with the counts and the time taken.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "receipts_bench.db"))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SECRET_KEY", "offline-benchmark")
+from app import models, schemas, crud, security, migrations
+from app.database import SessionLocal, engine
+
+PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "bench-admin@example.com"
+
+# (seller, category, typical items per receipt, [(item, price in yen)])
+SELLERS = [
+    ("セブン-イレブン 渋谷店", "Groceries", 3, [("おにぎり 鮭", 160), ("緑茶 500ml", 140), ("サンドイッチ", 320), ("からあげクン", 240), ("コーヒー R", 120), ("ヨーグルト", 150)]),
+    ("ファミリーマート 新宿店", "Groceries", 3, [("ファミチキ", 220), ("おにぎり ツナマヨ", 150), ("緑茶 500ml", 140), ("カフェラテ M", 180), ("プリン", 210)]),
+    ("イオン 幕張店", "Groceries", 9, [("牛乳 1L", 238), ("食パン 6枚", 178), ("卵 10個", 268), ("鶏むね肉", 398), ("キャベツ", 198), ("豆腐", 88), ("バナナ", 158), ("納豆 3P", 98), ("米 5kg", 2480)]),
+    ("西友 練馬店", "Groceries", 8, [("牛乳 1L", 218), ("卵 10個", 248), ("豚こま肉", 458), ("玉ねぎ 3玉", 198), ("トマト", 298), ("ヨーグルト", 148)]),
+    ("Whole Foods Market", "Groceries", 6, [("Organic Milk", 598), ("Sourdough Bread", 650), ("Avocado", 248), ("Greek Yogurt", 480), ("Almonds", 980)]),
+    ("スターバックス コーヒー", "Dining Out", 2, [("カフェラテ Tall", 495), ("ドリップコーヒー Short", 350), ("スコーン", 320), ("抹茶ラテ Tall", 530)]),
+    ("Starbucks Coffee", "Dining Out", 2, [("Caffe Latte", 495), ("Drip Coffee", 350), ("Blueberry Muffin", 380)]),
+    ("吉野家", "Dining Out", 2, [("牛丼 並盛", 468), ("味噌汁", 85), ("生卵", 90)]),
+    ("ラーメン 一蘭", "Dining Out", 2, [("天然とんこつラーメン", 980), ("替玉", 210), ("半熟塩ゆで玉子", 140)]),
+    ("居酒屋 和民", "Dining Out", 6, [("生ビール", 590), ("枝豆", 390), ("焼き鳥盛り合わせ", 890), ("唐揚げ", 690), ("ハイボール", 490)]),
+    ("ENEOS 環八店", "Fuel", 1, [("レギュラーガソリン", 6200), ("ハイオク", 7400)]),
+    ("出光 SS", "Fuel", 1, [("レギュラーガソリン", 5800)]),
+    ("ユニクロ 銀座店", "Shopping", 2, [("ヒートテック", 1290), ("エアリズム", 990), ("ジーンズ", 3990), ("ソックス 3P", 990)]),
+    ("ダイソー", "Shopping", 4, [("収納ボックス", 110), ("電池 4本", 110), ("ノート", 110), ("キッチンタオル", 220)]),
+    ("ヨドバシカメラ", "Shopping", 1, [("USB-Cケーブル", 1780), ("ワイヤレスイヤホン", 12800), ("SDカード 64GB", 2480)]),
+    ("TOHOシネマズ", "Entertainment", 2, [("映画鑑賞券 一般", 2000), ("ポップコーン M", 600), ("ドリンク", 400)]),
+    ("カラオケ館", "Entertainment", 2, [("ルーム料金", 1800), ("フリードリンク", 600)]),
+    ("JR東日本", "Travel", 1, [("乗車券 東京-横浜", 490), ("Suicaチャージ", 3000), ("新幹線 特急券", 4920)]),
+    ("東横イン 大阪駅前", "Travel", 1, [("宿泊料金", 8900)]),
+    ("東京電力 電気料金", "Utilities", 1, [("電気料金", 7800)]),
+    ("東京都水道局", "Utilities", 1, [("水道料金", 4200)]),
+]
+# Tax included in the printed prices: the reduced rate for food, the standard rate otherwise.
+TAX_RATES = {"Groceries": 0.08}
+STANDARD_TAX_RATE = 0.10
+
+
+def ocr_variant(rng: random.Random, name: str) -> str:
+    """Returns the item name as an OCR'd receipt might print it: a product code, a tax mark, full-width text."""
+    roll = rng.random()
+    if roll < 0.05:
+        return f"{rng.randint(4900000000000, 4999999999999)} {name}"
+    if roll < 0.10:
+        return f"{name} 軽"
+    if roll < 0.13:
+        return name.translate({code: code + 0xFEE0 for code in range(0x21, 0x7F)})
+    return name
+
+
+def make_receipt(rng: random.Random, seller_weights: list, start: datetime.datetime, days: int) -> schemas.ReceiptCreate:
+    seller, category, typical_items, catalog = rng.choices(SELLERS, weights=seller_weights)[0]
+    item_count = min(len(catalog) * 2, max(1, round(rng.expovariate(1 / typical_items))))
+    items = []
+    for _ in range(item_count):
+        name, price = rng.choice(catalog)
+        quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+        rate = float(round(price * rng.lognormvariate(0, 0.08)))
+        items.append(schemas.ItemCreate(item_name=ocr_variant(rng, name), quantity=quantity, rate=rate, subtotal=rate * quantity))
+    total = sum(item.subtotal for item in items)
+    tax_rate = TAX_RATES.get(category, STANDARD_TAX_RATE)
+    receipt_date = start + datetime.timedelta(days=rng.randrange(days), hours=rng.randint(8, 22), minutes=rng.randrange(60))
+    return schemas.ReceiptCreate(
+        seller_name=seller,
+        category=category,
+        receipt_date=receipt_date,
+        total_amount=total,
+        tax_amount=float(round(total * tax_rate / (1 + tax_rate))),
+        items=items,
+    )
+
+
+def generate(db, users: int = 20, receipts: int = 200, months: int = 12, seed: int = 42) -> dict:
+    """
+    Creates users bench-user-<n>@example.com (and an admin, ADMIN_EMAIL), all with PASSWORD.
+    Receipts per user follow a log-normal distribution around `receipts`; each user prefers a
+    few sellers (Zipf-like weights), and dates are spread over the last `months` months.
+    Returns the counts and the user emails.
+    """
+    rng = random.Random(seed)
+    hashed_password = security.get_password_hash(PASSWORD)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    days = max(1, months * 30)
+    start = today - datetime.timedelta(days=days)
+    emails = [f"bench-user-{n}@example.com" for n in range(users)]
+    created_users = created_receipts = 0
+
+    if crud.get_user_by_email(db, ADMIN_EMAIL) is None:
+        db.add(models.User(email=ADMIN_EMAIL, hashed_password=hashed_password, is_admin=True))
+        db.commit()
+        created_users += 1
+
+    for email in emails:
+        # Drawn before the existence check so every user's data only depends on the seed.
+        ranking = rng.sample(range(len(SELLERS)), len(SELLERS))
+        seller_weights = [1 / (ranking[i] + 1) ** 1.1 for i in range(len(SELLERS))]
+        receipt_count = max(1, round(rng.lognormvariate(math.log(receipts), 0.5)))
+        user_rng = random.Random(rng.random())
+        if crud.get_user_by_email(db, email) is not None:
+            continue
+        user = models.User(email=email, hashed_password=hashed_password)
+        db.add(user)
+        db.commit()
+        created_users += 1
+        created_receipts += crud.import_receipts(
+            db, (make_receipt(user_rng, seller_weights, start, days) for _ in range(receipt_count)),
+            user_id=user.id, user_email=email,
+        )
+    return {"users": created_users, "receipts": created_receipts, "emails": emails, "admin": ADMIN_EMAIL}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--receipts", type=int, default=200, help="median receipts per user")
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+        started = time.perf_counter()
+        result = generate(db, users=args.users, receipts=args.receipts, months=args.months, seed=args.seed)
+        print(json.dumps({
+            "database": engine.dialect.name,
+            "users_created": result["users"],
+            "receipts_created": result["receipts"],
+            "wall_s": round(time.perf_counter() - started, 3),
+        }))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
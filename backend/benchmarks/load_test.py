@@ -0,0 +1,277 @@
+"""
+Load-tests the API routes at increasing concurrency with offline OCR and LLM stubs.
+
+Usage: python benchmarks/load_test.py [--users N] [--receipts N] [--concurrency 1,4,16,64]
+                                      [--requests N] [--scenarios login,dashboard.kpis,...]
+                                      [--ocr-latency S] [--llm-latency S] [--output results.jsonl]
+
+The app runs in-process behind httpx's ASGI transport, against DATABASE_URL (a SQLite file in
+the temp directory by default; point it at a local Postgres to test that). The database is
+seeded with datagen.generate first. Each scenario is run --requests times per concurrency
+level by that many concurrent clients, as a random seeded user.
+
+Prints (or appends to --output) one JSON object per scenario and level, with throughput and
+p50/p95/p99 latency, tagged with the git commit so results can be compared over time.
+Deleting receipts and users is left out, since it would change the data between levels.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import datetime
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "receipts_bench.db"))
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ.setdefault("SECRET_KEY", "offline-benchmark")
+import httpx
+from benchmarks import datagen, stubs
+from app import migrations
+from app.database import SessionLocal, engine
+from main import app, lifespan
+
+SEARCH_TERMS = ["セブン", "イオン", "coffee", "牛乳", "ラーメン", "ガソリン", "ユニクロ", "latte"]
+JOB_POLL_INTERVAL = 0.02
+BULK_FILES = 4
+
+
+class Context:
+    """What the scenarios share: the client, the seeded users and their tokens, and a seeded RNG."""
+
+    def __init__(self, client, emails, rng):
+        self.client = client
+        self.emails = emails
+        self.rng = rng
+        self.user_tokens = []
+        self.admin_token = None
+
+    def user_headers(self):
+        return {"Authorization": f"Bearer {self.rng.choice(self.user_tokens)}"}
+
+    def admin_headers(self):
+        return {"Authorization": f"Bearer {self.admin_token}"}
+
+    def date_range(self):
+        """A random whole-month range within the last year, so the dashboard cache sees both hits and misses."""
+        today = datetime.date.today()
+        first, last = sorted(self.rng.sample(range(13), 2))
+        start = (today.replace(day=1) - datetime.timedelta(days=31 * last)).replace(day=1)
+        end = (today.replace(day=1) - datetime.timedelta(days=31 * first)).replace(day=1) - datetime.timedelta(days=1)
+        return {"start_date": start.isoformat(), "end_date": max(start, end).isoformat()}
+
+
+async def login(ctx):
+    return await ctx.client.post("/token", data={"username": ctx.rng.choice(ctx.emails), "password": datagen.PASSWORD})
+
+async def register(ctx):
+    return await ctx.client.post("/users/", json={"email": f"bench-new-{uuid.uuid4().hex}@example.com", "password": datagen.PASSWORD})
+
+async def receipts_recent(ctx):
+    return await ctx.client.get("/api/receipts/", headers=ctx.user_headers())
+
+async def receipts_page(ctx):
+    return await ctx.client.get("/api/receipts/all", params={"limit": 100}, headers=ctx.user_headers())
+
+async def receipts_search(ctx):
+    return await ctx.client.get("/api/receipts/search", params={"q": ctx.rng.choice(SEARCH_TERMS)}, headers=ctx.user_headers())
+
+async def receipts_export(ctx):
+    return await ctx.client.get("/api/receipts/export", params={"format": "csv"}, headers=ctx.user_headers())
+
+async def receipts_import(ctx):
+    receipt = datagen.make_receipt(ctx.rng, [1] * len(datagen.SELLERS), datetime.datetime.now() - datetime.timedelta(days=30), 30)
+    body = (receipt.model_dump_json() + "\n").encode()
+    return await ctx.client.post("/api/receipts/import", files={"file": ("receipts.ndjson", body)}, headers=ctx.user_headers())
+
+async def receipts_upload(ctx):
+    """Uploads a unique image and polls its job until it finishes, so the latency covers OCR, parsing and storage."""
+    headers = ctx.user_headers()
+    response = await ctx.client.post(
+        "/api/receipts/", params={"allow_duplicate": "true"},
+        files={"file": ("receipt.jpg", os.urandom(64 * 1024), "image/jpeg")}, headers=headers,
+    )
+    if response.status_code != 202:
+        return response
+    job_id = response.json()["id"]
+    while True:
+        response = await ctx.client.get(f"/api/receipts/jobs/{job_id}", headers=headers)
+        if response.status_code != 200 or response.json()["status"] in ("completed", "duplicate", "failed"):
+            return response
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def receipts_bulk(ctx):
+    """Uploads a batch of BULK_FILES unique images and reads the streamed results to the end."""
+    files = [("files", (f"receipt_{i}.jpg", os.urandom(64 * 1024), "image/jpeg")) for i in range(BULK_FILES)]
+    return await ctx.client.post("/api/receipts/bulk", params={"allow_duplicate": "true"}, files=files, headers=ctx.user_headers())
+
+def dashboard(endpoint):
+    async def request(ctx):
+        return await ctx.client.get(f"/api/dashboard/{endpoint}", params=ctx.date_range(), headers=ctx.user_headers())
+    return request
+
+async def admin_users(ctx):
+    return await ctx.client.get("/api/admin/users", headers=ctx.admin_headers())
+
+async def admin_receipts(ctx):
+    return await ctx.client.get("/api/admin/receipts", params={"limit": 100}, headers=ctx.admin_headers())
+
+async def admin_cache_stats(ctx):
+    return await ctx.client.get("/api/admin/cache-stats", headers=ctx.admin_headers())
+
+SCENARIOS = {
+    "login": login,
+    "register": register,
+    "receipts.recent": receipts_recent,
+    "receipts.page": receipts_page,
+    "receipts.search": receipts_search,
+    "receipts.export": receipts_export,
+    "receipts.import": receipts_import,
+    "receipts.upload": receipts_upload,
+    "receipts.bulk": receipts_bulk,
+    "dashboard.summary": dashboard("summary"),
+    "dashboard.kpis": dashboard("kpis"),
+    "dashboard.time-series": dashboard("time-series"),
+    "dashboard.chart-data": dashboard("chart-data"),
+    "dashboard.top-items": dashboard("top-items"),
+    "admin.users": admin_users,
+    "admin.receipts": admin_receipts,
+    "admin.cache-stats": admin_cache_stats,
+}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+def response_ok(response) -> bool:
+    if response.status_code >= 400:
+        return False
+    # Upload jobs and bulk uploads report failures in the body rather than in the status code.
+    path = response.request.url.path
+    if path.startswith("/api/receipts/jobs/"):
+        return response.json()["status"] != "failed"
+    if path == "/api/receipts/bulk":
+        return all(json.loads(line)["status"] != "failed" for line in response.text.splitlines() if line)
+    return True
+
+async def run_level(ctx, name, scenario, concurrency, requests):
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                ok = response_ok(await scenario(ctx))
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+async def run(args, emit):
+    rng = random.Random(args.seed)
+    transport = httpx.ASGITransport(app=app)
+    async with lifespan(app), httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        ctx = Context(client, args.emails, rng)
+        for email in args.emails:
+            response = await client.post("/token", data={"username": email, "password": datagen.PASSWORD})
+            ctx.user_tokens.append(response.json()["access_token"])
+        response = await client.post("/token", data={"username": datagen.ADMIN_EMAIL, "password": datagen.PASSWORD})
+        ctx.admin_token = response.json()["access_token"]
+
+        meta = {
+            "run_id": uuid.uuid4().hex[:12],
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "database": engine.dialect.name,
+            "users": len(args.emails),
+        }
+        for concurrency in args.concurrency:
+            for name in args.scenarios:
+                for _ in range(args.warmup):
+                    await SCENARIOS[name](ctx)
+                result = await run_level(ctx, name, SCENARIOS[name], concurrency, max(args.requests, concurrency))
+                emit(dict(meta, **result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--receipts", type=int, default=200, help="median receipts per seeded user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--ocr-latency", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--output", help="append the JSON lines to this file as well")
+    args = parser.parse_args()
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    stubs.install(ocr_latency=args.ocr_latency, llm_latency=args.llm_latency)
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+        seeded = datagen.generate(db, users=args.users, receipts=args.receipts, seed=args.seed)
+    finally:
+        db.close()
+    args.emails = seeded["emails"]
+
+    output = open(args.output, "a") if args.output else None
+
+    def emit(result):
+        line = json.dumps(result, ensure_ascii=False)
+        print(line, flush=True)
+        if output:
+            output.write(line + "\n")
+            output.flush()
+
+    try:
+        asyncio.run(run(args, emit))
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Offline stand-ins for the OCR and LLM backends, with configurable latency."""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+
+_RECEIPT_MARKER = re.compile(r"### RECEIPT (\d+)")
+# Read in the OCR worker processes, which inherit the environment but not module state.
+STUB_OCR_LATENCY_ENV = "STUB_OCR_LATENCY"
+
+
+def fake_receipt(index: int = 0) -> dict:
+    return {
+        "seller_name": f"Stub Store {index % 50}",
+        "category": random.choice(["Groceries", "Dining Out", "Shopping", "Fuel", "Other"]),
+        "receipt_date": f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}T12:00:00",
+        "items": [{"item_name": f"Item {index % 30}", "quantity": 1, "rate": 100.0, "subtotal": 100.0}],
+        "total_amount": 100.0,
+        "tax_amount": 8.0,
+    }
+
+
+class StubLLMClient:
+    """
+    Mimics GeminiClient.generate. Each call sleeps latency + per_receipt_latency * receipts
+    and answers single prompts with a JSON object and batch prompts with a JSON array.
+    failure_rate makes a share of calls raise, to exercise the retry path.
+    """
+
+    def __init__(self, latency=0.5, per_receipt_latency=0.02, failure_rate=0.0):
+        self.latency = latency
+        self.per_receipt_latency = per_receipt_latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+        indexes = [int(i) for i in _RECEIPT_MARKER.findall(prompt)]
+        time.sleep(self.latency + self.per_receipt_latency * max(1, len(indexes)))
+        if random.random() < self.failure_rate:
+            raise RuntimeError("stub LLM failure")
+        if not indexes:
+            return json.dumps(fake_receipt(random.randint(0, 1000)))
+        return json.dumps([dict(fake_receipt(i), index=i) for i in indexes])
+
+
+def stub_extract_text_from_image(image_path: str) -> str:
+    """
+    Mimics ocr_utils.extract_text_from_image: sleeps STUB_OCR_LATENCY seconds and returns text
+    unique to the file's contents, so identical uploads hit the caches and others do not.
+    The text is not a parsable receipt, so the parser chain falls through to the LLM.
+    """
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    time.sleep(float(os.getenv(STUB_OCR_LATENCY_ENV, "0.2")))
+    return f"STUB OCR {digest}"
+
+
+def install(ocr_latency=0.2, llm_latency=0.5, per_receipt_latency=0.02, failure_rate=0.0) -> StubLLMClient:
+    """Routes ingest through the stub OCR function and a new StubLLMClient, which is returned."""
+    from app import ingest, llm_utils
+    os.environ[STUB_OCR_LATENCY_ENV] = str(ocr_latency)
+    ingest.set_ocr_function(stub_extract_text_from_image)
+    client = StubLLMClient(latency=llm_latency, per_receipt_latency=per_receipt_latency, failure_rate=failure_rate)
+    llm_utils.set_llm_client(client)
+    return client
@@ -0,0 +1,22 @@
+from app.database import SessionLocal
+from app import search
+
+def build_search_index():
+    """Creates the trigram search indexes on Postgres, or rebuilds the inverted index on SQLite."""
+    db = SessionLocal()
+    try:
+        if search.uses_inverted_index(db):
+            indexed = search.rebuild_index(db)
+            print(f"Success! Indexed {indexed} receipts.")
+        else:
+            search.ensure_indexes(db)
+            print("Success! Trigram indexes are in place.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    build_search_index()
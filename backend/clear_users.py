@@ -1,22 +1,17 @@
 from app.database import SessionLocal
-from app.models import User, Receipt, Item # Import all three models
+from app import deletion
 
 print("Connecting to the database to clear all tables...")
 db = SessionLocal()
 try:
-    num_items_deleted = db.query(Item).delete()
-    print(f"Deleted {num_items_deleted} item(s).")
-
-    num_receipts_deleted = db.query(Receipt).delete()
-    print(f"Deleted {num_receipts_deleted} receipt(s).")
-
-    num_users_deleted = db.query(User).delete()
-    print(f"Deleted {num_users_deleted} user(s).")
-
-    db.commit()
+    # Deletes user by user in batches of DELETE_BATCH_SIZE receipts, so each transaction stays short.
+    totals = deletion.clear_all(db, progress=lambda counts: print(f"Deleted {counts['users']} user(s) so far..."))
+    print(f"Deleted {totals['items']} item(s).")
+    print(f"Deleted {totals['receipts']} receipt(s).")
+    print(f"Deleted {totals['users']} user(s).")
     print("Successfully cleared all tables.")
 except Exception as e:
     print(f"An error occurred: {e}")
     db.rollback()
 finally:
-    db.close()
\ No newline at end of file
+    db.close()
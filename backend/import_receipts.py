@@ -0,0 +1,38 @@
+import sys
+import time
+from app.database import SessionLocal
+from app.models import User
+from app import bulk_import
+
+def import_receipts_for_user(email: str, path: str, batch_size: int = 1000):
+    """Imports receipts from a JSON, NDJSON or CSV file into the account with the given email."""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+
+        if not user:
+            print(f"Error: User with email '{email}' not found.")
+            return
+
+        started = time.perf_counter()
+        with open(path, "rb") as stream:
+            result = bulk_import.import_file(db, stream, path, user_id=user.id, user_email=user.email, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"Imported {result['imported']} receipt(s) for '{email}' in {elapsed:.2f}s.")
+        if result["failed"]:
+            print(f"Skipped {result['failed']} invalid receipt(s):")
+            for error in result["errors"]:
+                print(f"  receipt {error['receipt']}: {error['error']}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python import_receipts.py <user_email> <receipts.json|receipts.ndjson|receipts.csv> [batch_size]")
+    else:
+        batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+        import_receipts_for_user(sys.argv[1], sys.argv[2], batch_size)
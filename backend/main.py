@@ -1,19 +1,32 @@
 import json
-from typing import Annotated, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Annotated, List, Optional
 from datetime import date
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from jose import JWTError, jwt
-from app import models, schemas, crud, security
-from app.database import SessionLocal, engine
-from app.ocr_utils import extract_text_from_image
-from app.llm_utils import parse_receipt_with_gemini
+from jose import JWTError
+from app import models, schemas, crud, security, ingest, cache, bulk_import, dashboard_cache, database, export, search, deletion, analytics, serialization, metrics
+from app.database import SessionLocal
 
-models.Base.metadata.create_all(bind=engine)
+# Nothing here touches the database or loads OCR/LLM libraries, so workers boot quickly and
+# offline; the schema is created by migrate.py, and ingest backends load on first use.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ingest.INGEST_PRELOAD:
+        await asyncio.to_thread(ingest.warm_up)
+    yield
+    ingest.shutdown()
+    deletion.shutdown()
+    await database.dispose_async_engine()
+    database.engine.dispose()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -28,6 +41,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 def get_db():
     db = SessionLocal()
@@ -36,26 +50,41 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with database.get_async_sessionmaker()() as db:
+        yield db
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
+def load_user(db: Session, email: str, user_id: Optional[int]):
+    """Looks the token's user up by primary key when the token carries one, else by email."""
+    if user_id is None:
+        return crud.get_user_by_email(db, email=email)
+    user = crud.get_user_by_id(db, user_id=user_id)
+    return user if user is not None and user.email == email else None
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
+        payload = security.decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = crud.get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
-    return user
+
+    principal = security.get_cached_principal(email)
+    if principal is None:
+        user = await db.run_sync(load_user, email, payload.get("uid"))
+        if user is None:
+            raise credentials_exception
+        principal = security.cache_principal(email, user)
+    # A detached User carrying only what the endpoints read; it never touches the session.
+    return models.User(**principal)
 
 def get_current_admin_user(current_user: Annotated[models.User, Depends(get_current_user)]):
     if not current_user.is_admin:
@@ -63,11 +92,11 @@ def get_current_admin_user(current_user: Annotated[models.User, Depends(get_curr
     return current_user
 
 @app.post("/token", tags=["Authentication"])
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, email=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_async_db)):
+    user = await db.run_sync(crud.get_user_by_email, email=form_data.username)
+    if not user or not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    access_token = security.create_access_token(data={"sub": user.email})
+    access_token = security.create_access_token(data={"sub": user.email, "uid": user.id, "admin": user.is_admin})
     return {"access_token": access_token, "token_type": "bearer", "is_admin": user.is_admin, "user_email": user.email}
 
 @app.post("/users/", response_model=schemas.User, tags=["Authentication"])
@@ -77,34 +106,109 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="Email already registered")
     return crud.create_user(db=db, user=user)
 
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """Prometheus scrape endpoint."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Welcome to the Personal Finance Assistant API"}
 
-@app.get("/api/receipts/", response_model=list[schemas.Receipt], tags=["Receipts"])
-def read_user_receipts(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db)):
-    return crud.get_receipts_by_user(db=db, user_id=current_user.id, limit=20)
-
-@app.get("/api/receipts/all", response_model=list[schemas.Receipt], tags=["Receipts"])
-def read_all_user_receipts(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db)):
-    return crud.get_all_receipts_by_user(db=db, user_id=current_user.id)
-
-@app.post("/api/receipts/", response_model=schemas.Receipt, tags=["Receipts"])
-async def upload_and_process_receipt(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db), file: UploadFile = File(...)):
-    temp_file_path = f"temp_{file.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        buffer.write(await file.read())
-    ocr_text = extract_text_from_image(temp_file_path)
-    if not ocr_text.strip():
-        raise HTTPException(status_code=400, detail="OCR failed to extract any text from the image.")
-    parsed_data = parse_receipt_with_gemini(ocr_text)
-    if not parsed_data:
-        raise HTTPException(status_code=500, detail="Gemini failed to parse the receipt text.")
+def receipt_fields(fields: Optional[str] = None, include: Optional[str] = None) -> tuple:
+    """
+    The receipt fields a listing returns: ?fields=id,seller_name,... picks them (default: the
+    receipt columns with owner_id), and ?include=items (or owner_email) adds the nested items.
+    """
+    try:
+        return serialization.parse_receipt_fields(fields, include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/receipts/", response_model=list[schemas.ReceiptSummary], tags=["Receipts"])
+async def read_user_receipts(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], fields: Annotated[tuple, Depends(receipt_fields)], db: AsyncSession = Depends(get_async_db)):
+    receipts = await db.run_sync(crud.get_receipts_by_user, user_id=current_user.id, limit=20, include_items="items" in fields)
+    return serialization.json_response(request, serialization.receipt_dicts(receipts, fields))
+
+async def paginate_receipts(request: Request, db: AsyncSession, user_id: Optional[int], fields: tuple, cursor: Optional[str], limit: int, start_date: Optional[date], end_date: Optional[date], category: Optional[str], seller: Optional[str]):
+    try:
+        receipts, next_cursor = await db.run_sync(crud.get_receipts_page, user_id=user_id, cursor=cursor, limit=limit, start_date=start_date, end_date=end_date, category=category, seller=seller, include_items="items" in fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return serialization.json_response(request, {"receipts": serialization.receipt_dicts(receipts, fields), "next_cursor": next_cursor})
+
+@app.get("/api/receipts/all", response_model=schemas.ReceiptSummaryPage, tags=["Receipts"])
+async def read_all_user_receipts(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], fields: Annotated[tuple, Depends(receipt_fields)], db: AsyncSession = Depends(get_async_db), cursor: Optional[str] = None, limit: int = 100, start_date: Optional[date] = None, end_date: Optional[date] = None, category: Optional[str] = None, seller: Optional[str] = None):
+    return await paginate_receipts(request, db, current_user.id, fields, cursor, limit, start_date, end_date, category, seller)
+
+def export_response(export_format: str, user_id: Optional[int], include_owner: bool, start_date: Optional[date], end_date: Optional[date], category: Optional[str], seller: Optional[str]):
+    if export_format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format. Use one of: {', '.join(export.EXPORT_FORMATS)}")
+    try:
+        chunks = export.stream(export_format, user_id=user_id, include_owner=include_owner, start_date=start_date, end_date=end_date, category=category, seller=seller)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed on the server.")
+    headers = {"Content-Disposition": f'attachment; filename="receipts.{export_format}"'}
+    return StreamingResponse(chunks, media_type=export.EXPORT_FORMATS[export_format], headers=headers)
+
+@app.get("/api/receipts/search", response_model=schemas.ReceiptSummaryPage, tags=["Receipts"])
+async def search_user_receipts(request: Request, q: str, current_user: Annotated[models.User, Depends(get_current_user)], fields: Annotated[tuple, Depends(receipt_fields)], db: AsyncSession = Depends(get_async_db), cursor: Optional[str] = None, limit: int = 20, start_date: Optional[date] = None, end_date: Optional[date] = None, category: Optional[str] = None):
+    """Finds the user's receipts by seller or item name, best match first."""
+    try:
+        receipts, next_cursor = await db.run_sync(search.search_receipts, user_id=current_user.id, q=q, cursor=cursor, limit=limit, start_date=start_date, end_date=end_date, category=category, include_items="items" in fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return serialization.json_response(request, {"receipts": serialization.receipt_dicts(receipts, fields), "next_cursor": next_cursor})
+
+@app.get("/api/receipts/export", tags=["Receipts"])
+async def export_user_receipts(current_user: Annotated[models.User, Depends(get_current_user)], export_format: str = Query("csv", alias="format"), start_date: Optional[date] = None, end_date: Optional[date] = None, category: Optional[str] = None, seller: Optional[str] = None):
+    """Streams the user's receipts, one row per item, as CSV, NDJSON or Parquet."""
+    return export_response(export_format, current_user.id, False, start_date, end_date, category, seller)
+
+@app.post("/api/receipts/", response_model=schemas.IngestJob, status_code=202, tags=["Receipts"])
+async def upload_and_process_receipt(current_user: Annotated[models.User, Depends(get_current_user)], file: UploadFile = File(...), allow_duplicate: bool = False):
+    if ingest.pending_count() >= ingest.MAX_PENDING_JOBS:
+        raise HTTPException(status_code=503, detail="Too many receipts are being processed. Please try again shortly.")
+    try:
+        image_path, image_digest = await ingest.save_upload(file)
+    except ingest.UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return ingest.submit_job(image_path, image_digest, file.filename, user_id=current_user.id, user_email=current_user.email, allow_duplicate=allow_duplicate)
+
+@app.post("/api/receipts/import", tags=["Receipts"])
+def import_receipts(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db), file: UploadFile = File(...)):
+    """Imports already-structured receipts from a JSON, NDJSON or CSV file."""
     try:
-        receipt_to_create = schemas.ReceiptCreate(**parsed_data)
-        return crud.create_receipt(db=db, receipt=receipt_to_create, user_id=current_user.id, user_email=current_user.email)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Validation error for Gemini's output: {e}")
+        return bulk_import.import_file(db, file.file, file.filename or "", user_id=current_user.id, user_email=current_user.email)
+    except bulk_import.InvalidImportFile as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/receipts/bulk", tags=["Receipts"])
+async def bulk_upload_receipts(current_user: Annotated[models.User, Depends(get_current_user)], files: List[UploadFile] = File(...), parallelism: int = ingest.BULK_PARALLELISM, allow_duplicate: bool = False):
+    """Processes many images (or ZIP archives of images) and streams one NDJSON line per image."""
+    saved_files = []
+    try:
+        # Copy out of the request's spooled files first; they are closed once this handler returns.
+        for file in files:
+            image_path, image_digest = await ingest.save_upload(file)
+            saved_files.append((file.filename, image_path, image_digest))
+    except BaseException as e:
+        ingest.remove_files(image_path for _, image_path, _ in saved_files)
+        if isinstance(e, ingest.UploadTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise
+    parallelism = max(1, min(parallelism, ingest.BULK_MAX_PARALLELISM))
+    results = ingest.process_bulk(saved_files, user_id=current_user.id, user_email=current_user.email, parallelism=parallelism, allow_duplicate=allow_duplicate)
+    return StreamingResponse((json.dumps(result) + "\n" async for result in results), media_type="application/x-ndjson")
+
+@app.get("/api/receipts/jobs/{job_id}", response_model=schemas.IngestJob, tags=["Receipts"])
+def get_receipt_job(job_id: str, current_user: Annotated[models.User, Depends(get_current_user)]):
+    job = ingest.get_job(job_id)
+    if not job or job["owner_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.delete("/api/receipts/{receipt_id}", tags=["Receipts"])
 def delete_user_receipt(receipt_id: int, current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db)):
@@ -114,43 +218,101 @@ def delete_user_receipt(receipt_id: int, current_user: Annotated[models.User, De
     crud.delete_receipt(db=db, receipt_id=receipt_id)
     return {"detail": "Receipt deleted successfully"}
 
+def _not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def cached_dashboard_response(request: Request, db: AsyncSession, user_id: int, endpoint: str, start_date: Optional[date], end_date: Optional[date], compute):
+    """
+    Serves a dashboard aggregate from the per-user cache, answering 304 when the client's copy is current.
+    On a miss, compute(session, user_id=..., start_date=..., end_date=...) runs on the async session.
+    """
+    async def render():
+        return serialization.dumps(await db.run_sync(compute, user_id=user_id, start_date=start_date, end_date=end_date))
+    entry = await dashboard_cache.get_or_compute(user_id, endpoint, start_date, end_date, render)
+    headers = {
+        "ETag": entry["etag"],
+        "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    # The client's copy is compared with the encoding it would be sent now.
+    etag = serialization.encoded_etag(entry["etag"], serialization.choose_encoding(request, len(entry["body"])))
+    if _not_modified(request, etag, entry["last_modified"]):
+        return Response(status_code=304, headers=dict(headers, ETag=etag, **serialization.vary_headers()))
+    return serialization.compressed_response(request, entry["body"], headers=headers)
+
+@app.get("/api/dashboard/summary", response_model=schemas.DashboardSummary, tags=["Dashboard"])
+async def get_dashboard_summary_for_user(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
+    return await cached_dashboard_response(request, db, current_user.id, "summary", start_date, end_date, crud.get_dashboard_summary)
+
 @app.get("/api/dashboard/kpis", response_model=schemas.KPIData, tags=["Dashboard"])
-def get_kpi_data_for_user(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
-    return crud.get_kpi_data(db=db, user_id=current_user.id, start_date=start_date, end_date=end_date)
+async def get_kpi_data_for_user(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
+    return await cached_dashboard_response(request, db, current_user.id, "kpis", start_date, end_date, crud.get_kpi_data)
 
 @app.get("/api/dashboard/time-series", response_model=list[schemas.TimeSeriesData], tags=["Dashboard"])
-def get_time_series_data_for_user(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
-    return crud.get_spending_over_time(db=db, user_id=current_user.id, start_date=start_date, end_date=end_date)
+async def get_time_series_data_for_user(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
+    return await cached_dashboard_response(request, db, current_user.id, "time-series", start_date, end_date, crud.get_spending_over_time)
 
 @app.get("/api/dashboard/chart-data", response_model=list[schemas.ChartData], tags=["Dashboard"])
-def get_chart_data(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
-    return crud.get_spending_by_category(db=db, user_id=current_user.id, start_date=start_date, end_date=end_date)
-
-@app.get("/api/dashboard/top-items", response_model=list[schemas.ChartData], tags=["Dashboard"])
-def get_top_items_data(current_user: Annotated[models.User, Depends(get_current_user)], db: Session = Depends(get_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
-    return crud.get_top_items(db=db, user_id=current_user.id, start_date=start_date, end_date=end_date)
+async def get_chart_data(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
+    return await cached_dashboard_response(request, db, current_user.id, "chart-data", start_date, end_date, crud.get_spending_by_category)
 
 @app.get("/api/dashboard/top-items", response_model=list[schemas.ChartData], tags=["Dashboard"])
-def get_top_items_data(
-    current_user: Annotated[models.User, Depends(get_current_user)],
-    db: Session = Depends(get_db),
-    start_date: Optional[date] = None,
-    end_date: Optional[date] = None
-):
-    return crud.get_top_items(db=db, user_id=current_user.id, start_date=start_date, end_date=end_date)
+async def get_top_items_data(request: Request, current_user: Annotated[models.User, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
+    return await cached_dashboard_response(request, db, current_user.id, "top-items", start_date, end_date, crud.get_top_items)
 
 @app.get("/api/admin/users", response_model=list[schemas.User], tags=["Admin"])
-def get_all_users_as_admin(admin_user: Annotated[models.User, Depends(get_current_admin_user)], db: Session = Depends(get_db)):
-    return crud.get_all_users(db=db)
+async def get_all_users_as_admin(request: Request, admin_user: Annotated[models.User, Depends(get_current_admin_user)], db: AsyncSession = Depends(get_async_db)):
+    users = await db.run_sync(crud.get_all_users)
+    return serialization.json_response(request, [{"id": user.id, "email": user.email, "is_admin": user.is_admin} for user in users])
 
-@app.get("/api/admin/receipts", response_model=list[schemas.Receipt], tags=["Admin"])
-def get_all_receipts_as_admin(admin_user: Annotated[models.User, Depends(get_current_admin_user)], db: Session = Depends(get_db)):
-    return crud.get_all_receipts(db=db)
+@app.get("/api/admin/receipts", response_model=schemas.ReceiptSummaryPage, tags=["Admin"])
+async def get_all_receipts_as_admin(request: Request, admin_user: Annotated[models.User, Depends(get_current_admin_user)], fields: Annotated[tuple, Depends(receipt_fields)], db: AsyncSession = Depends(get_async_db), cursor: Optional[str] = None, limit: int = 100, start_date: Optional[date] = None, end_date: Optional[date] = None, category: Optional[str] = None, seller: Optional[str] = None):
+    return await paginate_receipts(request, db, None, fields, cursor, limit, start_date, end_date, category, seller)
+
+@app.get("/api/admin/receipts/export", tags=["Admin"])
+async def export_all_receipts_as_admin(admin_user: Annotated[models.User, Depends(get_current_admin_user)], export_format: str = Query("csv", alias="format"), start_date: Optional[date] = None, end_date: Optional[date] = None, category: Optional[str] = None, seller: Optional[str] = None):
+    """Streams every user's receipts with an owner_email column."""
+    return export_response(export_format, None, True, start_date, end_date, category, seller)
+
+@app.get("/api/admin/analytics/summary", response_model=schemas.SpendingSummary, tags=["Admin"])
+async def get_spending_summary_as_admin(admin_user: Annotated[models.User, Depends(get_current_admin_user)], db: AsyncSession = Depends(get_async_db), start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """KPIs, category split and monthly series across all users, from the in-memory analytics index."""
+    return await db.run_sync(analytics.get_summary, analytics.ALL_USERS, start_date, end_date)
+
+@app.get("/api/admin/cache-stats", tags=["Admin"])
+def get_cache_stats_as_admin(admin_user: Annotated[models.User, Depends(get_current_admin_user)]):
+    return dict(cache.stats(), dashboard=dashboard_cache.stats(), analytics=analytics.stats())
 
 @app.delete("/api/admin/users/{user_id}", tags=["Admin"])
-def delete_user_as_admin(user_id: int, admin_user: Annotated[models.User, Depends(get_current_admin_user)], db: Session = Depends(get_db)):
+def delete_user_as_admin(user_id: int, admin_user: Annotated[models.User, Depends(get_current_admin_user)], response: Response, db: Session = Depends(get_db), background: bool = False):
+    """
+    Deletes the user with all their receipts in batches. With background=true, returns 202
+    and a deletion job straight away; poll /api/admin/deletions/{job_id} for progress.
+    """
     if user_id == admin_user.id:
         raise HTTPException(status_code=400, detail="Admin cannot delete their own account.")
+    if background:
+        if crud.get_user_by_id(db, user_id=user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        response.status_code = 202
+        return deletion.submit_user_deletion(user_id)
     if not crud.delete_user(db=db, user_id=user_id):
         raise HTTPException(status_code=404, detail="User not found")
-    return {"detail": "User and all their data deleted successfully"}
\ No newline at end of file
+    return {"detail": "User and all their data deleted successfully"}
+
+@app.get("/api/admin/deletions/{job_id}", response_model=schemas.DeletionJob, tags=["Admin"])
+def get_deletion_job(job_id: str, admin_user: Annotated[models.User, Depends(get_current_admin_user)]):
+    job = deletion.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return job
\ No newline at end of file
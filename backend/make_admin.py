@@ -1,6 +1,7 @@
 import sys
 from app.database import SessionLocal
 from app.models import User
+from app import security
 
 def make_user_admin(email: str):
     """Finds a user by email and sets their is_admin flag to True."""
@@ -14,7 +15,10 @@ def make_user_admin(email: str):
 
         user.is_admin = True
         db.commit()
+        # Servers cache principals in their own memory, which this process cannot reach, so the
+        # change shows up once their entry for this user expires.
         print(f"Success! User '{email}' has been granted admin privileges.")
+        print(f"Running servers pick this up within {security.PRINCIPAL_CACHE_TTL:g} seconds; the user should log in again to refresh their token.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
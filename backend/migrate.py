@@ -0,0 +1,18 @@
+from app.database import SessionLocal, engine
+from app import migrations
+
+def migrate():
+    """Creates or upgrades the database schema. Run once per deploy, before starting the API workers."""
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+        print(f"Success! The {engine.dialect.name} schema is up to date.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,28 @@
+import sys
+from app.database import SessionLocal
+from app.models import User
+from app import rollups
+
+def rebuild_rollups(email: str = None):
+    """Recomputes the monthly spending rollups from the receipts, for one user or for everyone."""
+    db = SessionLocal()
+    try:
+        user_id = None
+        if email:
+            user = db.query(User).filter(User.email == email).first()
+            if not user:
+                print(f"Error: User with email '{email}' not found.")
+                return
+            user_id = user.id
+
+        result = rollups.rebuild(db, user_id=user_id)
+        print(f"Success! Rebuilt {result['spending_rows']} category rows and {result['item_rows']} item rows.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild_rollups(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,40 @@
+import os
+import types
+import tempfile
+
+# app.database connects at import, so the test database has to be configured first.
+_DB_FILE = os.path.join(tempfile.mkdtemp(prefix="receipts_test_"), "test.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + _DB_FILE
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("SECRET_KEY", "test")
+
+import pytest
+from app import migrations, models, crud, schemas
+from app.database import SessionLocal
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    db = SessionLocal()
+    try:
+        migrations.upgrade(db)
+    finally:
+        db.close()
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user(db, request):
+    email = f"{request.node.name}@example.com"
+    db_user = crud.get_user_by_email(db, email) or crud.create_user(db, schemas.UserCreate(email=email, password="test"))
+    # Plain values, since some crud functions expunge everything from the session.
+    plain_user = types.SimpleNamespace(id=db_user.id, email=db_user.email)
+    yield plain_user
+    db.query(models.Receipt).filter(models.Receipt.owner_id == plain_user.id).delete()
+    db.commit()
@@ -0,0 +1,36 @@
+import io
+import json
+import os
+import pytest
+from app import bulk_import, models
+
+RECEIPT = {"seller_name": "Shop", "category": "Groceries", "receipt_date": "2024-05-01T10:00:00", "total_amount": 5,
+           "items": [{"item_name": "Milk", "quantity": 1, "rate": 5, "subtotal": 5}]}
+
+
+def receipt_count(db, user):
+    return db.query(models.Receipt).filter(models.Receipt.owner_id == user.id).count()
+
+def import_bytes(db, user, data: bytes, filename: str):
+    return bulk_import.import_file(db, io.BytesIO(data), filename, user_id=user.id, user_email=user.email, batch_size=1)
+
+
+def test_bad_ndjson_line_is_reported_and_the_rest_imported(db, user):
+    lines = [json.dumps(RECEIPT), '{"seller_name": "Broken",', json.dumps(dict(RECEIPT, seller_name="Other shop"))]
+    result = import_bytes(db, user, "\n".join(lines).encode() + b"\n" + b'{"seller_name": "\xff\xfe"}\n', "receipts.ndjson")
+    assert result["imported"] == 2
+    assert [error["receipt"] for error in result["errors"]] == [2, 4]
+    assert "Invalid JSON" in result["errors"][0]["error"]
+    assert "UTF-8" in result["errors"][1]["error"]
+    assert receipt_count(db, user) == 2
+
+@pytest.mark.parametrize("data, filename", [
+    (os.urandom(2048), "receipts.json"),
+    (b'[{"seller_name": "Shop",\n', "receipts.json"),
+    (b"42\n", "receipts.json"),
+    (b"\x00\x01garbage,\xff\n1,2,3\n", "receipts.csv"),
+])
+def test_unreadable_file_is_rejected_before_importing(db, user, data, filename):
+    with pytest.raises(bulk_import.InvalidImportFile):
+        import_bytes(db, user, data, filename)
+    assert receipt_count(db, user) == 0
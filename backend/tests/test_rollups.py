@@ -0,0 +1,61 @@
+import re
+import datetime
+from sqlalchemy import event
+from app import analytics, crud, rollups, schemas
+from app.database import engine
+
+
+def receipt(when: datetime.datetime, total: float, category: str = "Groceries"):
+    return schemas.ReceiptCreate(seller_name="Shop", category=category, receipt_date=when, total_amount=total, tax_amount=0,
+                                 items=[{"item_name": "Milk", "quantity": 1, "rate": total, "subtotal": total}])
+
+def statements_during(function):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        result = function()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return result, statements
+
+
+def test_split_date_range_whole_month():
+    assert rollups.split_date_range(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)) == (datetime.date(2024, 1, 1), datetime.date(2024, 2, 1), [])
+
+def test_split_date_range_partial_edges():
+    first_month, end_month, raw_ranges = rollups.split_date_range(datetime.date(2024, 1, 15), datetime.date(2024, 3, 10))
+    assert (first_month, end_month) == (datetime.date(2024, 2, 1), datetime.date(2024, 3, 1))
+    assert raw_ranges == [(datetime.date(2024, 1, 15), datetime.date(2024, 2, 1)), (datetime.date(2024, 3, 1), datetime.date(2024, 3, 11))]
+
+def test_full_month_is_answered_from_rollups_only(db, user, monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", False)
+    crud.create_receipts(db, [
+        receipt(datetime.datetime(2024, 1, 1), 10),
+        receipt(datetime.datetime(2024, 1, 31, 23, 30), 20),
+        receipt(datetime.datetime(2024, 2, 1), 40),
+    ], user_id=user.id, user_email=user.email)
+
+    kpis, statements = statements_during(lambda: crud.get_kpi_data(db, user.id, datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)))
+
+    assert float(kpis["total_spend"]) == 30
+    assert kpis["total_bills"] == 2
+    assert statements
+    assert not any(re.search(r"\b(receipts|items)\b", statement) for statement in statements)
+
+def test_end_date_covers_the_whole_day(db, user, monkeypatch):
+    crud.create_receipts(db, [
+        receipt(datetime.datetime(2024, 3, 10), 1),
+        receipt(datetime.datetime(2024, 3, 10, 18, 0), 2),
+        receipt(datetime.datetime(2024, 3, 11), 4),
+    ], user_id=user.id, user_email=user.email)
+    start_date, end_date = datetime.date(2024, 3, 5), datetime.date(2024, 3, 10)
+
+    monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", False)
+    assert float(crud.get_kpi_data(db, user.id, start_date, end_date)["total_spend"]) == 3
+    monkeypatch.setattr(analytics, "ANALYTICS_ENABLED", True)
+    analytics.invalidate_user(user.id)
+    assert crud.get_kpi_data(db, user.id, start_date, end_date)["total_spend"] == 3
+    assert len(crud.get_receipts_page(db, user_id=user.id, start_date=start_date, end_date=end_date)[0]) == 2
@@ -141,7 +141,9 @@ document.addEventListener('DOMContentLoaded', () => {
         const fileNameSpan = document.getElementById('file-name');
 
         fileInput.addEventListener('change', () => {
-            if (fileInput.files.length > 0) {
+            if (fileInput.files.length > 1) {
+                fileNameSpan.textContent = `${fileInput.files.length} 個のファイル`;
+            } else if (fileInput.files.length > 0) {
                 fileNameSpan.textContent = fileInput.files[0].name;
             } else {
                 fileNameSpan.textContent = "ファイルが選択されていません";
@@ -159,26 +161,17 @@ document.addEventListener('DOMContentLoaded', () => {
                 queryParams = `?start_date=${startDate}&end_date=${endDate}`;
             }
             try {
-                const [kpiRes, categoryRes, timeRes, topItemsRes] = await Promise.all([
-                    fetch(`${API_URL}/api/dashboard/kpis${queryParams}`, { headers: { 'Authorization': `Bearer ${userToken}` }}),
-                    fetch(`${API_URL}/api/dashboard/chart-data${queryParams}`, { headers: { 'Authorization': `Bearer ${userToken}` }}),
-                    fetch(`${API_URL}/api/dashboard/time-series${queryParams}`, { headers: { 'Authorization': `Bearer ${userToken}` }}),
-                    fetch(`${API_URL}/api/dashboard/top-items${queryParams}`, { headers: { 'Authorization': `Bearer ${userToken}` }})
-                ]);
-
-                const kpis = await kpiRes.json();
+                const response = await fetch(`${API_URL}/api/dashboard/summary${queryParams}`, { headers: { 'Authorization': `Bearer ${userToken}` }});
+                const summary = await response.json();
+
+                const kpis = summary.kpis;
                 document.getElementById('total-spend-kpi').textContent = `¥${kpis.total_spend.toFixed(2)}`;
                 document.getElementById('total-tax-kpi').textContent = `¥${kpis.total_tax.toFixed(2)}`;
                 document.getElementById('total-bills-kpi').textContent = kpis.total_bills;
 
-                const categoryData = await categoryRes.json();
-                renderCategoryChart(categoryData);
-
-                const timeData = await timeRes.json();
-                renderTimeSeriesChart(timeData);
-                
-                const topItemsData = await topItemsRes.json();
-                renderTopItems(topItemsData);
+                renderCategoryChart(summary.category);
+                renderTimeSeriesChart(summary.time_series);
+                renderTopItems(summary.top_items);
 
             } catch (error) {
                 console.error("ダッシュボード取得エラー:", error);
@@ -266,6 +259,47 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
 
+        async function waitForReceiptJob(jobId) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const response = await fetch(`${API_URL}/api/receipts/jobs/${jobId}`, { headers: { 'Authorization': `Bearer ${userToken}` } });
+                if (!response.ok) throw new Error('処理状況を取得できませんでした。');
+                const job = await response.json();
+                if (job.status === 'completed') return job;
+                if (job.status === 'duplicate') throw new Error('このレシートは既にアップロードされています。');
+                if (job.status === 'failed') throw new Error(`処理に失敗しました: ${job.error}`);
+            }
+        }
+
+        async function uploadInBulk(files) {
+            const formData = new FormData();
+            Array.from(files).forEach(file => formData.append('files', file));
+            const response = await fetch(`${API_URL}/api/receipts/bulk`, {
+                method: 'POST',
+                headers: { 'Authorization': `Bearer ${userToken}` },
+                body: formData
+            });
+            if (!response.ok) throw new Error('アップロードに失敗しました。');
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let done = 0, failed = 0;
+            while (true) {
+                const { value, done: streamDone } = await reader.read();
+                if (streamDone) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.filter(line => line.trim()).forEach(line => {
+                    const result = JSON.parse(line);
+                    done += 1;
+                    if (result.status !== 'completed') failed += 1;
+                });
+                uploadResult.innerHTML = `<p>${done} 件処理済み（失敗・重複 ${failed} 件）…</p>`;
+            }
+            return { done, failed };
+        }
+
         uploadForm.addEventListener('submit', async (e) => {
             e.preventDefault();
             uploadResult.innerHTML = '';
@@ -278,6 +312,20 @@ document.addEventListener('DOMContentLoaded', () => {
                 uploadButton.textContent = 'アップロードして処理';
                 return;
             }
+            if (fileInput.files.length > 1 || file.name.toLowerCase().endsWith('.zip')) {
+                try {
+                    const { done, failed } = await uploadInBulk(fileInput.files);
+                    uploadResult.innerHTML = `<p style="color: green;">${done - failed} / ${done} 件のレシートを登録しました。</p>`;
+                    fetchAndDisplayReceipts();
+                    fetchDashboardData();
+                } catch (error) {
+                    uploadResult.innerHTML = `<p class="error-message">${error.message}</p>`;
+                } finally {
+                    uploadButton.disabled = false;
+                    uploadButton.textContent = 'アップロードして処理';
+                }
+                return;
+            }
             const formData = new FormData();
             formData.append('file', file);
             try {
@@ -287,6 +335,8 @@ document.addEventListener('DOMContentLoaded', () => {
                     body: formData
                 });
                 if (!response.ok) throw new Error('アップロードに失敗しました。');
+                const job = await response.json();
+                await waitForReceiptJob(job.id);
                 uploadResult.innerHTML = `<p style="color: green;">アップロード成功！</p>`;
                 fetchAndDisplayReceipts();
                 fetchDashboardData();
@@ -310,16 +360,27 @@ document.addEventListener('DOMContentLoaded', () => {
         const tableBody = document.getElementById('receipts-table-body');
         const searchBar = document.getElementById('search-bar');
         const downloadBtn = document.getElementById('download-csv-btn');
+        const loadMoreBtn = document.getElementById('load-more-btn');
         let allReceipts = [];
-
-        async function fetchAllReceipts() {
-            tableBody.innerHTML = '<tr><td colspan="6">レシートを読み込み中…</td></tr>';
+        let nextCursor = null;
+
+        async function fetchAllReceipts(append = false) {
+            if (!append) tableBody.innerHTML = '<tr><td colspan="6">レシートを読み込み中…</td></tr>';
+            const params = new URLSearchParams();
+            const query = searchBar.value.trim();
+            if (query) params.set('q', query);
+            if (append && nextCursor) params.set('cursor', nextCursor);
+            // Searches seller and item names server-side, ranked by relevance.
+            const endpoint = query ? 'search' : 'all';
             try {
-                const response = await fetch(`${API_URL}/api/receipts/all`, {
+                const response = await fetch(`${API_URL}/api/receipts/${endpoint}?${params}`, {
                     headers: { 'Authorization': `Bearer ${userToken}` }
                 });
                 if (!response.ok) throw new Error('レシートを取得できませんでした。');
-                allReceipts = await response.json();
+                const page = await response.json();
+                allReceipts = append ? allReceipts.concat(page.receipts) : page.receipts;
+                nextCursor = page.next_cursor;
+                loadMoreBtn.classList.toggle('hidden', !nextCursor);
                 renderTable(allReceipts);
             } catch (error) {
                 tableBody.innerHTML = `<tr><td colspan="6" class="error-message">${error.message}</td></tr>`;
@@ -379,37 +440,36 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         });
 
+        let searchTimer = null;
         function filterTable() {
-            const searchTerm = searchBar.value.toLowerCase();
-            const filteredReceipts = allReceipts.filter(receipt =>
-                receipt.seller_name.toLowerCase().includes(searchTerm)
-            );
-            renderTable(filteredReceipts);
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => fetchAllReceipts(), 300);
         }
 
-        function downloadCSV() {
-            const rows = Array.from(tableBody.querySelectorAll('tr'));
-            if (rows.length === 0 || rows[0].children.length <= 1) {
-                alert("ダウンロードするデータがありません。");
-                return;
+        async function downloadCSV() {
+            const params = new URLSearchParams({ format: 'csv' });
+            if (searchBar.value.trim()) params.set('seller', searchBar.value.trim());
+            try {
+                const response = await fetch(`${API_URL}/api/receipts/export?${params}`, {
+                    headers: { 'Authorization': `Bearer ${userToken}` }
+                });
+                if (!response.ok) throw new Error('CSVをダウンロードできませんでした。');
+                const url = URL.createObjectURL(await response.blob());
+                const link = document.createElement("a");
+                link.setAttribute("href", url);
+                link.setAttribute("download", "receipts_report.csv");
+                document.body.appendChild(link);
+                link.click();
+                document.body.removeChild(link);
+                URL.revokeObjectURL(url);
+            } catch (error) {
+                alert(error.message);
             }
-            const headers = ['Seller Name', 'Category', 'Receipt Date', 'Upload Date', 'Total Amount'];
-            let csvContent = "data:text/csv;charset=utf-8," + headers.join(',') + '\n';
-            rows.forEach(row => {
-                const rowData = Array.from(row.children).map(cell => `"${cell.textContent.trim()}"`).slice(0, 5);
-                csvContent += rowData.join(',') + '\n';
-            });
-            const encodedUri = encodeURI(csvContent);
-            const link = document.createElement("a");
-            link.setAttribute("href", encodedUri);
-            link.setAttribute("download", "receipts_report.csv");
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
         }
 
         searchBar.addEventListener('keyup', filterTable);
         downloadBtn.addEventListener('click', downloadCSV);
+        loadMoreBtn.addEventListener('click', () => fetchAllReceipts(true));
         fetchAllReceipts();
     }
     
@@ -419,9 +479,30 @@ document.addEventListener('DOMContentLoaded', () => {
         const receiptsTableBody = document.getElementById('all-receipts-table-body');
         const userSearchBar = document.getElementById('user-search-bar');
         const receiptSearchBar = document.getElementById('receipt-search-bar');
+        const receiptsLoadMoreBtn = document.getElementById('receipts-load-more-btn');
 
         let allUsers = [];
         let allReceipts = [];
+        let receiptsCursor = null;
+
+        async function fetchAdminReceipts(append = false) {
+            const params = new URLSearchParams({ fields: 'id,owner_id,owner_email,seller_name,category,upload_date,total_amount' });
+            if (receiptSearchBar.value.trim()) params.set('seller', receiptSearchBar.value.trim());
+            if (append && receiptsCursor) params.set('cursor', receiptsCursor);
+            try {
+                const receiptsResponse = await fetch(`${API_URL}/api/admin/receipts?${params}`, {
+                    headers: { 'Authorization': `Bearer ${userToken}` }
+                });
+                if (!receiptsResponse.ok) throw new Error('レシートを取得できませんでした。');
+                const page = await receiptsResponse.json();
+                allReceipts = append ? allReceipts.concat(page.receipts) : page.receipts;
+                receiptsCursor = page.next_cursor;
+                receiptsLoadMoreBtn.classList.toggle('hidden', !receiptsCursor);
+                renderReceiptsTable(allReceipts);
+            } catch (error) {
+                receiptsTableBody.innerHTML = `<tr><td colspan="6" class="error-message">${error.message}</td></tr>`;
+            }
+        }
 
         async function fetchAdminData() {
             try {
@@ -439,16 +520,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 return;
             }
 
-            try {
-                const receiptsResponse = await fetch(`${API_URL}/api/admin/receipts`, {
-                    headers: { 'Authorization': `Bearer ${userToken}` }
-                });
-                if (!receiptsResponse.ok) throw new Error('レシートを取得できませんでした。');
-                allReceipts = await receiptsResponse.json();
-                renderReceiptsTable(allReceipts);
-            } catch (error) {
-                receiptsTableBody.innerHTML = `<tr><td colspan="6" class="error-message">${error.message}</td></tr>`;
-            }
+            await fetchAdminReceipts();
         }
 
         function renderUsersTable(users) {
@@ -472,7 +544,7 @@ document.addEventListener('DOMContentLoaded', () => {
             receiptsTableBody.innerHTML = receipts.map(receipt => `
                 <tr>
                     <td>${receipt.id}</td>
-                    <td>${receipt.owner ? receipt.owner.email : `User ID: ${receipt.owner_id}`}</td>
+                    <td>${receipt.owner_email || `User ID: ${receipt.owner_id}`}</td>
                     <td>${receipt.seller_name}</td>
                     <td>${receipt.category}</td>
                     <td>${new Date(receipt.upload_date).toLocaleDateString()}</td>
@@ -483,8 +555,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         async function handleDeleteUser(userId) {
             if (!confirm("このユーザーとそのすべてのデータを削除してもよろしいですか？この操作は元に戻せません。")) return;
+            let deleteButton = null;
             try {
-                const response = await fetch(`${API_URL}/api/admin/users/${userId}`, {
+                const response = await fetch(`${API_URL}/api/admin/users/${userId}?background=true`, {
                     method: 'DELETE',
                     headers: { 'Authorization': `Bearer ${userToken}` }
                 });
@@ -492,10 +565,33 @@ document.addEventListener('DOMContentLoaded', () => {
                      const errorData = await response.json();
                      throw new Error(errorData.detail || 'ユーザーの削除に失敗しました。');
                 }
+                const job = await response.json();
+                deleteButton = usersTableBody.querySelector(`.delete-btn[data-id="${userId}"]`);
+                if (deleteButton) deleteButton.disabled = true;
+                await waitForDeletionJob(job.id, deleteButton);
+                allUsers = allUsers.filter(user => String(user.id) !== String(userId));
                 const rowToDelete = usersTableBody.querySelector(`tr[data-user-id="${userId}"]`);
                 if (rowToDelete) rowToDelete.remove();
             } catch (error) {
                 alert(error.message);
+                if (deleteButton) {
+                    deleteButton.disabled = false;
+                    deleteButton.textContent = '削除';
+                }
+            }
+        }
+
+        async function waitForDeletionJob(jobId, progressButton) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const response = await fetch(`${API_URL}/api/admin/deletions/${jobId}`, { headers: { 'Authorization': `Bearer ${userToken}` } });
+                if (!response.ok) throw new Error('削除の進行状況を取得できませんでした。');
+                const job = await response.json();
+                if (job.status === 'completed') return job;
+                if (job.status === 'failed') throw new Error(`ユーザーの削除に失敗しました: ${job.error}`);
+                if (progressButton && job.receipts_total) {
+                    progressButton.textContent = `削除中 ${job.receipts_deleted}/${job.receipts_total}`;
+                }
             }
         }
 
@@ -514,13 +610,12 @@ document.addEventListener('DOMContentLoaded', () => {
             renderUsersTable(filteredUsers);
         });
         
+        let receiptSearchTimer = null;
         receiptSearchBar.addEventListener('keyup', () => {
-            const searchTerm = receiptSearchBar.value.toLowerCase();
-            const filteredReceipts = allReceipts.filter(receipt => 
-                receipt.seller_name.toLowerCase().includes(searchTerm)
-            );
-            renderReceiptsTable(filteredReceipts);
+            clearTimeout(receiptSearchTimer);
+            receiptSearchTimer = setTimeout(() => fetchAdminReceipts(), 300);
         });
+        receiptsLoadMoreBtn.addEventListener('click', () => fetchAdminReceipts(true));
 
         fetchAdminData();
     }